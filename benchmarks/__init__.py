@@ -0,0 +1,4 @@
+# Benchmarks
+#
+# Times sshconfig on synthetic inventories of hosts.
+# Run 'python -m benchmarks --help' from the top of the source tree.
@@ -0,0 +1,115 @@
+# Usage {{{1
+"""
+Benchmark sshconfig
+
+Times sshconfig on synthetic inventories of hosts.
+
+Usage:
+    benchmarks [options]
+
+Options:
+    -s SIZES, --sizes SIZES      comma separated list of inventory sizes
+                                 [default: 1k,10k,100k]
+    -r N, --repeat N             number of times each case is run [default: 3]
+    -o FILE, --output FILE       save the results to FILE as JSON
+    -b FILE, --baseline FILE     compare the results to those saved in FILE
+    -t PCT, --tolerance PCT      percentage slowdown allowed before a case is
+                                 reported as a regression [default: 20]
+    -i MS, --import-budget MS    time allowed to import the command line
+                                 interface, in milliseconds [default: 150]
+    -d DIR, --dir DIR            keep the corpora in DIR rather than in a
+                                 temporary directory
+
+The available sizes are 1k, 10k and 100k hosts.  The exit status is 1 if a
+case is slower than the baseline by more than the tolerance or if the import
+time exceeds its budget.
+
+Run using 'python -m benchmarks' from the top of the source tree; the copy
+of sshconfig found there is benchmarked.  The corpora use XDG environment
+variables to direct sshconfig to them, and so the benchmarks only run on
+Linux.
+"""
+
+# License {{{1
+# Copyright (C) 2018-2023 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see http://www.gnu.org/licenses.
+
+
+# Imports {{{1
+from docopt import docopt
+from inform import (
+    Error, Inform, conjoin, display, done, fatal, full_stop, os_error,
+    terminate, warn
+)
+from pathlib import Path
+import tempfile
+
+from .bench import compare, measure_import_time, run_cases, save_results
+from .corpus import SIZES, Corpus
+
+
+# Main {{{1
+def main():
+    with Inform(prog_name="benchmarks"):
+        cmdline = docopt(__doc__)
+        try:
+            sizes = cmdline["--sizes"].split(",")
+            unknown = [size for size in sizes if size not in SIZES]
+            if unknown:
+                raise Error(
+                    "unknown size.", culprit=conjoin(unknown),
+                    codicil=f"Choose from {conjoin(SIZES, ' or ')}."
+                )
+            repeat = int(cmdline["--repeat"])
+            tolerance = float(cmdline["--tolerance"]) / 100
+            import_budget = float(cmdline["--import-budget"]) / 1000
+        except ValueError as e:
+            fatal(full_stop(e))
+        except Error as e:
+            e.terminate()
+
+        try:
+            with tempfile.TemporaryDirectory(prefix="sshconfig-bench-") as tmp:
+                root = Path(cmdline["--dir"] or tmp)
+                results = dict(import_time=measure_import_time(), sizes={})
+                display(f"import time: {1000*results['import_time']:.1f} ms")
+                for size in sizes:
+                    display(f"generating {size} corpus ...")
+                    corpus = Corpus(root / size, SIZES[size]).generate()
+                    results["sizes"][size] = run_cases(corpus, repeat)
+
+            if cmdline["--output"]:
+                save_results(cmdline["--output"], results)
+
+            failed = False
+            if results["import_time"] > import_budget:
+                warn(
+                    f"import time of {1000*results['import_time']:.1f} ms",
+                    f"exceeds budget of {1000*import_budget:.0f} ms."
+                )
+                failed = True
+            if cmdline["--baseline"]:
+                failed |= compare(results, cmdline["--baseline"], tolerance)
+            if failed:
+                terminate(1)
+        except Error as e:
+            e.terminate()
+        except OSError as e:
+            fatal(os_error(e))
+        done()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Bench
+#
+# Runs sshconfig on a corpus and records how long it takes.
+
+# License {{{1
+# Copyright (C) 2018-2023 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see http://www.gnu.org/licenses.
+
+
+# Imports {{{1
+from inform import Error, display, full_stop, os_error, warn
+import json
+import os
+from pathlib import Path
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+# Globals {{{1
+SOURCE_DIR = Path(__file__).resolve().parent.parent
+RUN_SSHCONFIG = "from sshconfig.main import main; main()"
+IMPORT_REPEAT = 5
+
+# the cases that are run on each corpus: name, arguments, start without caches
+CASES = [
+    ("create cold", ["create", "--force"], True),
+    ("create warm", ["create", "--force"], False),
+    ("create no-op", ["create"], False),
+    ("find", ["find", "host00012"], False),
+    ("show", ["show", "host000123"], False),
+]
+
+
+# Utilities {{{1
+# environ() {{{2
+# the environment in which sshconfig is run, the source tree is used
+def environ(extra=None):
+    env = dict(os.environ, **(extra or {}))
+    path = env.get("PYTHONPATH")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SOURCE_DIR), path]))
+    return env
+
+
+# flatten_phases() {{{2
+# converts the phases written by --timings-json into a dictionary that maps
+# the path of each phase to its wall clock time
+def flatten_phases(phases):
+    flattened = {}
+    stack = []
+    for phase in phases:
+        del stack[phase["depth"]:]
+        stack.append(phase["name"])
+        flattened["/".join(stack)] = phase["wall"]
+    return flattened
+
+
+# run_sshconfig() {{{2
+# runs sshconfig once, returns the elapsed time and the recorded timings
+def run_sshconfig(corpus, args):
+    timings_file = corpus.dir / "timings.json"
+    cmd = [
+        sys.executable, "-c", RUN_SSHCONFIG,
+        "--quiet", "--timings-json", str(timings_file)
+    ] + args
+    start = time.perf_counter()
+    process = subprocess.run(
+        cmd, env=environ(corpus.environ()), cwd=corpus.dir,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    elapsed = time.perf_counter() - start
+    if process.returncode:
+        raise Error(
+            "sshconfig failed.", culprit=" ".join(args),
+            codicil=process.stderr.strip()
+        )
+    timings = json.loads(timings_file.read_text())
+    return elapsed, timings
+
+
+# Benchmarks {{{1
+# run_cases() {{{2
+def run_cases(corpus, repeat):
+    """Run each case on the corpus and return the results.
+
+    The results map the name of each case to its best, median and individual
+    times along with the phases of the best run.
+    """
+    cache_dir = corpus.data_dir / "sshconfig" / "cache"
+    results = {}
+    for name, args, cold in CASES:
+        times = []
+        best = None
+        for i in range(repeat):
+            if cold:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            elapsed, timings = run_sshconfig(corpus, args)
+            times.append(elapsed)
+            if best is None or elapsed < best[0]:
+                best = elapsed, timings
+        elapsed, timings = best
+        results[name] = dict(
+            best = elapsed,
+            median = statistics.median(times),
+            times = times,
+            phases = flatten_phases(timings["phases"]),
+            slowest_hosts = timings["slowest_hosts"],
+        )
+        display(f"    {name:<14} {1000*elapsed:10.1f} ms")
+    return results
+
+
+# measure_import_time() {{{2
+def measure_import_time():
+    "Return the time taken to import the command line interface, in seconds."
+    cmd = [sys.executable, "-X", "importtime", "-c", "import sshconfig.main"]
+    times = []
+    for i in range(IMPORT_REPEAT):
+        process = subprocess.run(
+            cmd, env=environ(), cwd=SOURCE_DIR, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, universal_newlines=True
+        )
+        for line in process.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == "sshconfig.main":
+                times.append(int(fields[1]) / 1e6)
+    if not times:
+        raise Error("could not measure import time.", codicil=process.stderr)
+    return min(times)
+
+
+# save_results() {{{2
+def save_results(path, results):
+    results = dict(
+        results,
+        python = platform.python_version(),
+        platform = platform.platform(),
+        date = time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    )
+    try:
+        Path(path).write_text(json.dumps(results, indent=2) + "\n")
+    except OSError as e:
+        raise Error(os_error(e))
+
+
+# compare() {{{2
+def compare(results, path, tolerance):
+    """Compare the results to a baseline saved earlier.
+
+    Displays the ratio of the new to the baseline times for each case and
+    returns True if any case slowed by more than tolerance (a fraction).
+    """
+    try:
+        baseline = json.loads(Path(path).read_text())
+    except OSError as e:
+        raise Error(os_error(e))
+    except ValueError as e:
+        raise Error(full_stop(e), culprit=path)
+
+    rows = [("import", results["import_time"], baseline.get("import_time"))]
+    for size, cases in results["sizes"].items():
+        for name, result in cases.items():
+            base = baseline.get("sizes", {}).get(size, {}).get(name, {})
+            rows.append((f"{size} {name}", result["best"], base.get("best")))
+
+    regressed = False
+    display("\ncomparison to baseline:")
+    for name, new, old in rows:
+        if not old:
+            display(f"    {name:<20} {1000*new:10.1f} ms   (not in baseline)")
+            continue
+        ratio = new / old
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  <-- regression"
+            regressed = True
+        display(
+            f"    {name:<20} {1000*new:10.1f} ms {1000*old:10.1f} ms",
+            f"{ratio:6.2f}x{flag}"
+        )
+    if regressed:
+        warn(f"some cases are more than {100*tolerance:.0f}% slower than baseline.")
+    return regressed
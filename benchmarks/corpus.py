@@ -0,0 +1,221 @@
+# Corpus
+#
+# Generates synthetic configuration directories for the benchmarks.
+
+# License {{{1
+# Copyright (C) 2018-2023 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see http://www.gnu.org/licenses.
+
+
+# Imports {{{1
+from pathlib import Path
+import random
+from textwrap import dedent
+
+# Globals {{{1
+NUM_NETWORKS = 20
+MAX_DEPTH = 8  # longest chain of HostEntry subclasses
+CIPHERS = "aes256-gcm@openssh.com aes128-gcm@openssh.com aes256-ctr aes128-ctr"
+UNAVAILABLE_CIPHERS = "3des-cbc blowfish-cbc"
+MACS = "hmac-sha2-512-etm@openssh.com hmac-sha2-256-etm@openssh.com"
+KEX = "curve25519-sha256 diffie-hellman-group16-sha512"
+IDENTITY_FILES = "id_ed25519 id_rsa".split()
+SIZES = dict([("1k", 1_000), ("10k", 10_000), ("100k", 100_000)])
+
+
+# Utilities {{{1
+# mac() {{{2
+def mac(n):
+    return "02:00:00:00:{:02x}:{:02x}".format(n // 256, n % 256)
+
+
+# network_name() {{{2
+def network_name(n):
+    return f"net{n:02d}"
+
+
+# host_name() {{{2
+def host_name(n):
+    return f"host{n:06d}"
+
+
+# Corpus class {{{1
+class Corpus:
+    """A synthetic sshconfig configuration.
+
+    dir (path):
+        The directory that holds the corpus.  It contains home (used as HOME),
+        config (used as XDG_CONFIG_HOME) and data (used as XDG_DATA_HOME).
+    num_hosts (int):
+        The number of host entries in hosts.conf, not counting the guests and
+        tunnels that are generated from them.
+    seed (int):
+        Seed for the random number generator, the same seed always produces
+        the same corpus.
+    """
+
+    def __init__(self, dir, num_hosts, seed=0):
+        self.dir = Path(dir)
+        self.num_hosts = num_hosts
+        self.home = self.dir / "home"
+        self.config_dir = self.dir / "config" / "sshconfig"
+        self.data_dir = self.dir / "data"
+        self.macs_file = self.dir / "macs"
+        self.random = random.Random(seed)
+
+    # environ() {{{2
+    # the environment variables needed to run sshconfig on this corpus
+    def environ(self):
+        return dict(
+            HOME = str(self.home),
+            XDG_CONFIG_HOME = str(self.config_dir.parent),
+            XDG_DATA_HOME = str(self.data_dir),
+        )
+
+    # generate() {{{2
+    def generate(self):
+        ssh_dir = self.home / ".ssh"
+        ssh_dir.mkdir(parents=True, exist_ok=True)
+        for name in IDENTITY_FILES:
+            (ssh_dir / name).touch()
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+
+        # the first network is the one that is detected as available
+        self.macs_file.write_text(mac(0) + "\n")
+
+        files = dict(
+            ssh = self.ssh_conf(),
+            networks = self.networks_conf(),
+            locations = self.locations_conf(),
+            proxies = self.proxies_conf(),
+            hosts = self.hosts_conf(),
+        )
+        for name, contents in files.items():
+            (self.config_dir / (name + ".conf")).write_text(contents)
+        return self
+
+    # ssh_conf() {{{2
+    def ssh_conf(self):
+        # the available algorithms are given explicitly so ssh is not run
+        return dedent(f"""
+            CONFIG_FILE = {str(self.home / ".ssh" / "config")!r}
+            DEFAULTS = '''
+            host *
+                ForwardX11 no
+                ServerAliveInterval 60
+            '''.strip()
+            OVERRIDES = "Ciphers aes256-gcm@openssh.com"
+            AVAILABLE_CIPHERS = {CIPHERS.split()!r}
+            AVAILABLE_MACS = {MACS.split()!r}
+            AVAILABLE_KEX_ALGORITHMS = {KEX.split()!r}
+        """).lstrip()
+
+    # networks_conf() {{{2
+    def networks_conf(self):
+        lines = ["from sshconfig import NetworkEntry", ""]
+        for n in range(NUM_NETWORKS):
+            lines += [
+                f"class {network_name(n).capitalize()}(NetworkEntry):",
+                f"    description = 'network {n}'",
+                f"    routers = [{mac(n)!r}, {mac(n + 256)!r}]",
+            ]
+            if n % 5 == 1:
+                lines.append("    proxy = 'host000000'")
+            if n % 5 == 2:
+                lines.append("    ports = [22, 443]")
+            if n % 5 == 3:
+                lines.append("    location = 'tokyo'")
+            lines.append("")
+        preferred = [network_name(n) for n in range(0, NUM_NETWORKS, 3)]
+        lines += [
+            f"PREFERRED_NETWORKS = {preferred!r}",
+            "ROUTER_MACS = dict(",
+            f"    style='custom', executable='cat {self.macs_file}', column=1",
+            ")",
+        ]
+        return "\n".join(lines) + "\n"
+
+    # locations_conf() {{{2
+    @staticmethod
+    def locations_conf():
+        return "LOCATIONS = {'home': 'San Francisco', 'tokyo': 'Tokyo'}\n"
+
+    # proxies_conf() {{{2
+    @staticmethod
+    def proxies_conf():
+        return "PROXIES = {'tunnel': 'ssh host000000 -W %h:%p'}\n"
+
+    # hosts_conf() {{{2
+    def hosts_conf(self):
+        """Generate hosts.conf.
+
+        The hosts form chains of subclasses up to MAX_DEPTH long.  Some hosts
+        have per-network hostnames, guests, port forwards, identity files or
+        algorithm lists that include unavailable algorithms.
+        """
+        rand = self.random
+        lines = ["from sshconfig import HostEntry, VNC", ""]
+        parent = None
+        depth = 0
+        for n in range(self.num_hosts):
+            name = host_name(n)
+            if parent is None or depth >= rand.randint(1, MAX_DEPTH):
+                base = "HostEntry"
+                depth = 0
+            else:
+                base = parent
+                depth += 1
+            lines.append(f"class {name.capitalize()}({base}):")
+            lines.append(f"    description = 'synthetic host {n}'")
+            if n % 3 == 0:
+                hostnames = {
+                    network_name(k): f"10.{k}.{n // 256 % 256}.{n % 256}"
+                    for k in rand.sample(range(NUM_NETWORKS), 3)
+                }
+                hostnames["default"] = f"{name}.example.com"
+                lines.append(f"    hostname = {hostnames!r}")
+            else:
+                lines.append(f"    hostname = '{name}.example.com'")
+            if n % 4 == 0:
+                lines.append(f"    user = 'user{n % 17}'")
+            if n % 5 == 0:
+                lines.append(f"    aliases = ['a{n}']")
+            if n % 10 == 0:
+                lines.append(f"    guests = ['vm1', ('vm2', 'second guest of {name}')]")
+            if n % 7 == 0:
+                lines.append(
+                    f"    localForward = ['{10000 + n % 50000} localhost:25', VNC({n % 10})]"
+                )
+            if n % 11 == 0:
+                lines.append(f"    remoteForward = ['{20000 + n % 40000} localhost:22']")
+            if n % 13 == 0:
+                lines.append(f"    dynamicForward = {30000 + n % 30000}")
+            if n % 2 == 0:
+                lines.append(f"    identityFile = {IDENTITY_FILES!r}")
+            elif n % 9 == 0:
+                lines.append("    identityFile = 'missing_key'")
+            if n % 6 == 0:
+                ciphers = rand.sample(
+                    (CIPHERS + " " + UNAVAILABLE_CIPHERS).split(), 3
+                )
+                lines.append(f"    ciphers = {','.join(ciphers)!r}")
+            if n % 8 == 0:
+                lines.append(f"    port = {rand.choice([22, 443, 2222])}")
+            if n % 12 == 0:
+                lines.append("    trusted = True")
+            lines.append("")
+            parent = name.capitalize()
+        return "\n".join(lines)
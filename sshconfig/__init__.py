@@ -1,14 +1,31 @@
 __version__ = "2.2.1"
 __released__ = "2023-11-08"
 
-from .sshconfig import (
-    VNC,
-    HostEntry,
-    NetworkEntry,
-    filter_algorithms,
-    get_network_name,
-    is_ip_addr,
-    locations,
-    ports,
+# the public names are imported when first used, so the command line interface
+# does not pay for importing them when running commands such as version and help
+_exports = dict(
+    VNC = "sshconfig",
+    HostEntry = "sshconfig",
+    NetworkEntry = "sshconfig",
+    filter_algorithms = "sshconfig",
+    get_network_name = "sshconfig",
+    is_ip_addr = "sshconfig",
+    locations = "sshconfig",
+    ports = "sshconfig",
+    gethostname = "utilities",
+    getusername = "utilities",
 )
-from .utilities import gethostname, getusername
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(f".{_exports[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
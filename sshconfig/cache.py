@@ -0,0 +1,216 @@
+# Caches
+#
+# Support for the persistent caches kept in the data directory.
+
+# License {{{1
+# Copyright (C) 2018-2023 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see http://www.gnu.org/licenses.
+
+
+# Imports {{{1
+import hashlib
+import os
+import pickle
+
+from inform import log, os_error
+from shlib import to_path
+
+from .preferences import CACHE_DIR, DATA_DIR
+
+# Globals {{{1
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+# Utilities {{{1
+# cache_path() {{{2
+def cache_path(*names):
+    "Returns path to a file in the cache directory."
+    return to_path(DATA_DIR, CACHE_DIR, *names)
+
+
+# digest() {{{2
+def digest(data):
+    "Returns a hex digest of a byte or text string."
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+# file_digest() {{{2
+def file_digest(path):
+    "Returns a hex digest of the contents of a file, None if it cannot be read."
+    try:
+        return digest(to_path(path).read_bytes())
+    except OSError:
+        return None
+
+
+# write_atomically() {{{2
+def write_atomically(path, data, mode=0o600):
+    """Write a file so that readers never see a partially written version.
+
+    The data is written to a temporary file in the same directory, flushed to
+    disk, and then renamed over the original.
+    """
+    writer = AtomicWriter(path, mode)
+    try:
+        writer.write(data)
+        writer.commit()
+    except OSError:
+        writer.discard()
+        raise
+
+
+# symlink_atomically() {{{2
+def symlink_atomically(path, target):
+    """Make path a symbolic link to target, replacing whatever path was.
+
+    The link is created under a temporary name and then renamed over path, so
+    path always exists.
+    """
+    path = to_path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        os.symlink(target, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
+
+
+# save_cache() {{{2
+def save_cache(path, data):
+    """Write a cache file, reporting rather than raising any errors.
+
+    Failing to update a cache only costs time on the next run, so it is not
+    treated as an error.
+    """
+    try:
+        write_atomically(path, data)
+    except OSError as e:
+        log("cannot update cache:", os_error(e))
+
+
+# AtomicWriter class {{{1
+class AtomicWriter:
+    """Writes a file incrementally, replacing the original only when committed.
+
+    path (path):
+        The file to write.  The text is written through a buffer to a
+        temporary file in the same directory, which is flushed to disk and
+        renamed over path by commit().  discard() abandons it.
+    mode (int):
+        The permissions of the new file.
+    tee (callable):
+        If given, it is called with each piece of text as it is written.
+    """
+    def __init__(self, path, mode=0o600, tee=None):
+        self.path = to_path(path)
+        self.tee = tee
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        fd = os.open(self.tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        self.file = os.fdopen(fd, "wb", buffering=WRITE_BUFFER_SIZE)
+
+    # write() {{{2
+    # writes a byte or text string
+    def write(self, data):
+        if self.tee:
+            self.tee(data)
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.file.write(data)
+
+    # commit() {{{2
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    # discard() {{{2
+    def discard(self):
+        self.file.close()
+        try:
+            self.tmp_path.unlink()
+        except OSError:
+            pass
+
+
+# DirectoryCache class {{{1
+class DirectoryCache:
+    """Answers whether files exist from a single listing of each directory.
+
+    path (path):
+        The file in which the listings are kept between runs, if given.  A saved
+        listing is only used if the modification time of its directory is
+        unchanged.
+
+    Files that are referenced through broken symbolic links are considered to
+    exist.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.listings = {}  # directory -> names, as used in this run
+        self.saved = {}  # directory -> (mtime, names)
+        self.modified = False
+        if path:
+            try:
+                with to_path(path).open("rb") as f:
+                    self.saved = pickle.load(f)
+            except Exception:
+                pass
+
+    # exists() {{{2
+    def exists(self, path):
+        directory, name = os.path.split(str(path))
+        try:
+            names = self.listings[directory]
+        except KeyError:
+            names = self.listings[directory] = self._list(directory)
+        return name in names
+
+    # _list() {{{2
+    def _list(self, directory):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return frozenset()
+        saved = self.saved.get(directory)
+        if saved and saved[0] == mtime:
+            return saved[1]
+        try:
+            names = frozenset(os.listdir(directory))
+        except OSError:
+            return frozenset()
+        self.saved[directory] = (mtime, names)
+        self.modified = True
+        return names
+
+    # save() {{{2
+    # saves the listings of the directories used in this run, if any were used
+    def save(self):
+        if not self.path or not self.listings:
+            return
+        if self.modified or self.saved.keys() != self.listings.keys():
+            listings = {
+                directory: self.saved[directory]
+                for directory in self.listings
+                if directory in self.saved
+            }
+            save_cache(self.path, pickle.dumps(listings))
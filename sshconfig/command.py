@@ -16,10 +16,17 @@
 
 
 # Imports {{{1
+from datetime import datetime
+import multiprocessing
+import os
 import sys
-import arrow
+import time
 from docopt import docopt
-from inform import Error, columns, dedent, display, full_stop, join, narrate, output
+from inform import (
+    Error, columns, conjoin, dedent, display, error, full_stop, join, narrate,
+    output, plural, warn
+)
+from . import timings
 from .preferences import (
     DATE_FORMAT,
     DEFAULT_COMMAND,
@@ -27,10 +34,11 @@ from .preferences import (
     SSH_HEADER,
     SSH_HOSTS,
     SSH_OVERRIDES,
+    UNKNOWN_NETWORK_NAME,
     fold
 )
 from .sshconfig import NetworkEntry
-from .utilities import two_columns
+from .utilities import format_date, two_columns
 
 
 # Utilities {{{1
@@ -39,8 +47,22 @@ def title(text):
     return full_stop(text.capitalize())
 
 
+# get_jobs() {{{2
+# converts the value of a --jobs option to the number of processes to use
+def get_jobs(value, default=1):
+    try:
+        jobs = int(value) if value else default
+    except ValueError:
+        raise Error("expected an integer.", culprit=value)
+    if jobs < 1:
+        raise Error("expected a positive integer.", culprit=value)
+    return jobs
+
+
 # Command base class {{{1
 class Command(object):
+    REQUIRES_SETTINGS = True  # the conf files are read and network identified
+
     @classmethod
     def commands(cls):
         for cmd in cls.__subclasses__():
@@ -95,6 +117,96 @@ class Command(object):
         return text.format(title=title(cls.DESCRIPTION), usage=cls.USAGE)
 
 
+# CheckCommand command {{{1
+class CheckCommand(Command):
+    NAMES = "check".split()
+    DESCRIPTION = "check the host configurations on every network"
+    USAGE = dedent(
+        """
+        Usage:
+            sshconfig check [options]
+
+        Options:
+            -j N, --jobs N     number of networks to check at once, defaults to
+                               the number of CPUs
+
+        Processes every host on every network and reports the problems found:
+        invalid port forwards, hostnames given for unknown networks, unknown
+        SSH settings, missing identity files, and blocked ports.  Nothing is
+        written.
+
+        The exit status is 1 if any errors are found.  Blocked ports are
+        reported as warnings and do not affect the exit status, as they are
+        expected on some networks.
+        """
+    ).strip()
+
+    @classmethod
+    def run(cls, command, args, settings, options):
+        # read command line
+        cmdline = docopt(cls.USAGE, argv=[command] + args)
+        jobs = get_jobs(cmdline["--jobs"], os.cpu_count() or 1)
+
+        names = settings.network_names()
+        results = cls.check(settings, options, names, jobs)
+
+        # merge the problems found on each network
+        problems = {}
+        for name, diagnostics in zip(names, results):
+            for diagnostic in diagnostics:
+                networks = problems.setdefault(diagnostic, [])
+                if name not in networks:
+                    networks.append(name)
+
+        # report them
+        num_errors = num_warnings = 0
+        for (severity, culprit, message), networks in problems.items():
+            if len(networks) == len(names):
+                where = "on all networks"
+            else:
+                where = "on " + conjoin(networks)
+            if severity == "error":
+                error(full_stop(f"{message} ({where})"), culprit=culprit)
+                num_errors += 1
+            else:
+                warn(full_stop(f"{message} ({where})"), culprit=culprit)
+                num_warnings += 1
+        display(
+            f"{plural(num_errors):# error/s} and",
+            f"{plural(num_warnings):# warning/s}",
+            f"found on {plural(names):# network/s}."
+        )
+        return 1 if num_errors else 0
+
+    # check() {{{2
+    # checks each network, concurrently in forked processes if possible
+    @classmethod
+    def check(cls, settings, options, names, jobs):
+        jobs = min(jobs, len(names))
+        if jobs < 2 or "fork" not in multiprocessing.get_all_start_methods():
+            return [settings.check_network(name, options) for name in names]
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        # the workers are forked, so they inherit the settings and the
+        # configuration files that have already been read
+        global checking
+        checking = settings, options
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(jobs, mp_context=context) as pool:
+            return list(pool.map(check_network, names))
+
+
+# check_network() {{{2
+# runs in a worker process forked by CheckCommand.check()
+checking = None
+
+
+def check_network(name):
+    settings, options = checking
+    return settings.check_network(name, options)
+
+
 # CreateCommand command {{{1
 class CreateCommand(Command):
     NAMES = "create".split()
@@ -102,23 +214,104 @@ class CreateCommand(Command):
     USAGE = dedent(
         """
         Usage:
-            sshconfig create
+            sshconfig create [options]
+
+        Options:
+            -a, --all-networks  generate a file for every network and link the
+                                SSH config file to the one for this network
+            -f, --force         regenerate the file even if nothing has changed
+            -j N, --jobs N      render the hosts using N processes [default: 1]
         """
     ).strip()
 
     @classmethod
     def run(cls, command, args, settings, options):
         # read command line
-        docopt(cls.USAGE, argv=[command] + args)
+        cmdline = docopt(cls.USAGE, argv=[command] + args)
+        jobs = get_jobs(cmdline["--jobs"])
+        if cmdline["--all-networks"]:
+            cls.create_all(settings, options, jobs)
+        else:
+            cls.create(settings, cmdline["--force"], jobs)
 
+    # create() {{{2
+    # generates the SSH config file, also used by the watch command
+    @classmethod
+    def create(cls, settings, force=False, jobs=1):
         # display summary
         display(full_stop(settings.get_summary()))
 
         # initialize the network
+        # the init script is run even if the SSH config file is up to date, as
+        # it may connect a VPN or mount file systems; it must be run before
+        # reading the hosts file as it may try to do network operations
+        with timings.phase("init script"):
+            settings.initialize_network()
+
+        # skip if nothing has changed since SSH config file was last generated
+        with timings.phase("fingerprint"):
+            fingerprint = settings.fingerprint()
+            up_to_date = settings.is_up_to_date(fingerprint)
+        if not force and up_to_date:
+            narrate("SSH config file is up to date.")
+            return
+
+        with timings.phase("render"):
+            writer = settings.open_ssh_config()
+            try:
+                shards = cls.render(settings, writer, jobs)
+            except BaseException:
+                writer.discard()
+                raise
+        with timings.phase("write"):
+            settings.close_ssh_config(writer, force, shards)
+            settings.save_search_index(fingerprint)
+            settings.save_manifest(fingerprint)
+
+    # create_all() {{{2
+    # generates an SSH config file for every network, then links the SSH
+    # config file to the one for the current network and saves the search
+    # index and manifest for it
+    @classmethod
+    def create_all(cls, settings, options, jobs=1):
+        identified = settings.identified_networks
+        current = settings.primary_network.name()
+        for name in settings.network_names():
+            settings.configure_network(dict(options, **{"--network": name}))
+            display(full_stop(settings.get_summary()))
+            writer = settings.open_network_config(name)
+            try:
+                cls.render(settings, writer, jobs)
+            except BaseException:
+                writer.discard()
+                raise
+            writer.commit()
+            if name == current:
+                fingerprint = settings.fingerprint()
+                hosts = settings.hosts
+
+        # return to the current network
+        settings.configure_network(options, identified)
+        cls.switch(settings)
+        settings.hosts = hosts
+        settings.save_search_index(fingerprint)
+        settings.save_manifest(fingerprint)
+
+    # switch() {{{2
+    @classmethod
+    def switch(cls, settings):
+        display(full_stop(settings.get_summary()))
         settings.initialize_network()
-        # initializing the network must be done before reading the hosts
-        # file as it may try to do network operations
-
+        settings.link_ssh_config(settings.primary_network.name())
+
+    # render() {{{2
+    # writes the contents of the SSH config file for the chosen network,
+    # the host entries are written as they are rendered
+    # if SHARD_HOSTS is set, the host entries are instead written to a file for
+    # each group, which are included by the SSH config file, and the files are
+    # returned
+    @classmethod
+    def render(cls, settings, writer, jobs=1):
         # create SSH config file components
         # header
         name = settings.primary_network.Name()
@@ -127,8 +320,7 @@ class CreateCommand(Command):
             network = f"{name} network — {desc}"
         else:
             network = f"{name} network"
-        now = arrow.now()
-        time = now.format(DATE_FORMAT)
+        time = format_date(datetime.now().astimezone(), DATE_FORMAT)
         header = SSH_HEADER.format(
             network=network, time=time, config_dir=settings.config_dir,
             cmdline=join(*sys.argv)
@@ -139,22 +331,30 @@ class CreateCommand(Command):
         if overrides:
             overrides = SSH_OVERRIDES.format(overrides=overrides, fold=fold(1))
 
-        # hosts
-        settings.read_hosts()
-        hosts = SSH_HOSTS.format(hosts=settings.hosts.output(), fold=fold(1))
-
         # defaults
         defaults = settings.ssh_defaults
         if defaults:
             defaults = SSH_DEFAULTS.format(defaults=defaults, fold=fold(1))
 
-        # combine everything and write as SSH config file
-        contents = "\n\n\n".join(
-            section.strip()
-            for section in [header, overrides, hosts, defaults]
-            if section
-        )
-        settings.write_ssh_config(contents + '\n')
+        # write everything, sections are separated by two blank lines
+        writer.write(header.strip())
+        if overrides:
+            writer.write("\n\n\n" + overrides.strip())
+        before, _, after = SSH_HOSTS.partition("{hosts}")
+        writer.write("\n\n\n" + before.format(fold=fold(1)).rstrip())
+        shards = None
+        if settings.shard_hosts:
+            settings.read_hosts(jobs=jobs, shard=True)
+            shards = settings.write_shards(writer.path)
+            if shards.paths:
+                writer.write("\n" + shards.includes())
+        else:
+            settings.read_hosts(writer, jobs)
+        writer.write(after.rstrip())
+        if defaults:
+            writer.write("\n\n\n" + defaults.strip())
+        writer.write("\n")
+        return shards
 
 
 # FindCommand command {{{1
@@ -164,7 +364,15 @@ class FindCommand(Command):
     USAGE = dedent(
         """
         Usage:
-            sshconfig find <text>
+            sshconfig find [options] <text>
+
+        Options:
+            -a, --all       also search hostnames, descriptions, users and ports
+            -p, --prefix    match only at the beginning
+            -r, --regex     <text> is a regular expression
+            -f, --fuzzy     match if the characters of <text> appear in order
+
+        The search is case insensitive.
         """
     ).strip()
 
@@ -174,11 +382,23 @@ class FindCommand(Command):
         cmdline = docopt(cls.USAGE, argv=[command] + args)
         text = cmdline["<text>"]
 
+        from .search import SearchIndex
+
+        fields = SearchIndex.FIELDS if cmdline["--all"] else ["name"]
+        mode = "substring"
+        for each in ["prefix", "regex", "fuzzy"]:
+            if cmdline["--" + each]:
+                mode = each
+
+        # use the index saved by create if it is current, else process hosts
+        index = settings.load_search_index()
+        if not index:
+            settings.read_hosts()
+            index = SearchIndex(settings.hosts.search_terms)
+
         # display matches
-        settings.read_hosts()
-        for name in settings.hosts.hosts_by_name.keys():
-            if text in name:
-                display(name)
+        for name in index.search(text, mode, fields):
+            display(name)
 
 
 # HelpCommand {{{1
@@ -193,6 +413,7 @@ class HelpCommand(Command):
     ).strip()
     REQUIRES_EXCLUSIVITY = False
     COMPOSITE_CONFIGS = None
+    REQUIRES_SETTINGS = False
 
     @classmethod
     def run(cls, command, args, settings, options):
@@ -265,11 +486,112 @@ class ShowCommand(Command):
         display()
 
         # display host
-        settings.read_hosts()
-        try:
-            display(settings.hosts.hosts_by_name[name])
-        except KeyError:
+        host = settings.read_host(name)
+        if not host:
             raise Error("not found.", culprit=name)
+        display(host)
+
+
+# WatchCommand command {{{1
+class WatchCommand(Command):
+    NAMES = "watch".split()
+    DESCRIPTION = "regenerate the SSH config file as the network changes"
+    USAGE = dedent(
+        """
+        Usage:
+            sshconfig watch [options]
+
+        Options:
+            -i SECS, --interval SECS   how often to check the conf files
+                                       [default: 5]
+            -d SECS, --debounce SECS   wait until the network has been quiet
+                                       this long before examining it
+                                       [default: 1]
+
+        Creates the SSH config file, and then recreates it whenever the
+        available networks change or a conf file is modified.  Runs until
+        terminated.
+        """
+    ).strip()
+
+    @classmethod
+    def run(cls, command, args, settings, options):
+        # read command line
+        cmdline = docopt(cls.USAGE, argv=[command] + args)
+        try:
+            interval = float(cmdline["--interval"])
+            debounce = float(cmdline["--debounce"])
+        except ValueError as e:
+            raise Error(full_stop(e))
+
+        from .neighbors import NetworkMonitor
+        from .settings import Settings
+
+        CreateCommand.create(settings)
+        mtimes = Settings.conf_mtimes()
+        monitor = NetworkMonitor()
+        try:
+            while True:
+                changed = monitor.wait(interval)
+                if changed:
+                    # wait for a burst of events to subside
+                    deadline = time.monotonic() + interval
+                    while time.monotonic() < deadline and monitor.wait(debounce):
+                        pass
+
+                try:
+                    # reread the conf files if any have been modified
+                    new_mtimes = Settings.conf_mtimes()
+                    if new_mtimes != mtimes:
+                        mtimes = new_mtimes
+                        narrate("conf files have changed.")
+                        # the conf files must be fixed before continuing
+                        settings = None
+                        settings = Settings(options)
+                        CreateCommand.create(settings)
+                        continue
+
+                    # otherwise regenerate only if the networks have changed
+                    if not changed or not settings or options["--network"]:
+                        continue
+                    networks = settings.identify_networks()
+                    if networks == settings.identified_networks:
+                        continue
+                    narrate("networks have changed.")
+                    settings.configure_network(options, networks)
+                    CreateCommand.create(settings)
+                except Error as e:
+                    e.report()
+        finally:
+            monitor.close()
+
+
+# SwitchCommand command {{{1
+class SwitchCommand(Command):
+    NAMES = "switch".split()
+    DESCRIPTION = "link the SSH config file to the one generated for a network"
+    USAGE = dedent(
+        """
+        Usage:
+            sshconfig switch [<network>]
+
+        Replaces the SSH config file with a link to the file generated for the
+        network by 'sshconfig create --all-networks'.  If the network is not
+        given, it is determined automatically.
+        """
+    ).strip()
+
+    @classmethod
+    def run(cls, command, args, settings, options):
+        # read command line
+        cmdline = docopt(cls.USAGE, argv=[command] + args)
+        name = cmdline["<network>"]
+
+        if name:
+            if name != UNKNOWN_NETWORK_NAME and not NetworkEntry.find(name):
+                raise Error("unknown network.", culprit=name)
+            settings.configure_network(dict(options, **{"--network": name}))
+        CreateCommand.switch(settings)
 
 
 # VersionCommand {{{1
@@ -282,6 +604,7 @@ class VersionCommand(Command):
             sshconfig version
         """
     ).strip()
+    REQUIRES_SETTINGS = False
 
     @classmethod
     def run(cls, command, args, settings, options):
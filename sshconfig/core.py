@@ -1,19 +1,81 @@
 # Core internal classes and functions
 
 # Imports {{{1
+import os
+import pickle
 import re
+from sys import intern
 
-from inform import display, indent, is_str, log, warn
+from inform import (
+    Error, display, full_stop, indent, is_str, log, narrate, os_error, warn
+)
 from shlib import to_path
 
-from .preferences import DEFAULT_NETWORK_NAME, SSH_SETTINGS, fold
-from .sshconfig import NetworkEntry
+from . import __version__
+from .cache import DirectoryCache, cache_path, digest, save_cache
+from .preferences import (
+    DEFAULT_NETWORK_NAME, DIRECTORY_CACHE_FILE, HOSTS_CACHE_CONTEXTS,
+    HOSTS_CACHE_DIR, SSH_SETTINGS, fold
+)
+from .sshconfig import HostEntry, NetworkEntry, locations, ports
+from .utilities import abbreviate_names, gc_paused
+
+
+# Globals {{{1
+# change the version if the format of the cached entries changes
+HOSTS_CACHE_VERSION = 7
+REPORTERS = dict(display=display, log=log, warn=warn)
+YES_NO = {True: "yes", False: "no"}
+MAX_LISTED_HOSTS = 5  # hosts named when reporting an unknown SSH setting
+KEYWORDS = {}  # attribute name -> (line prefix, is known SSH setting)
+
+
+# keyword {{{1
+# Returns the start of the line for an attribute and whether it is a known SSH
+# setting.  Resolved once for each distinct attribute name.
+def keyword(key):
+    try:
+        return KEYWORDS[key]
+    except KeyError:
+        canonical = SSH_SETTINGS.get(key.lower())
+        resolved = KEYWORDS[key] = (
+            "    {} ".format(canonical or key), canonical is not None
+        )
+        return resolved
+
+
+# Block Class {{{1
+class Block:
+    """A rendered SSH host entry, as kept in the host cache.
+
+    names (tuple of str):
+        The names that select the entry: the host name and its aliases.
+    text (str):
+        The entry as it appears in the SSH config file.
+    terms (tuple):
+        The hostnames, descriptions, users and ports of the host, each a tuple
+        of strings, used by find (see SearchIndex.TERM_FIELDS).
+    """
+    __slots__ = ("names", "text", "terms")
+
+    def __init__(self, names, text, terms):
+        self.names = names
+        self.text = text
+        self.terms = terms
+
+    # pickle as the arguments of the constructor, which is more compact than
+    # the default of a dictionary of slot values
+    def __reduce__(self):
+        return Block, (self.names, self.text, self.terms)
 
 
 # Fields Class {{{1
 class Fields:
+    __slots__ = ("fields", "unknown")
+
     def __init__(self):
         self.fields = []
+        self.unknown = {}  # attribute names that are not SSH settings
 
     def append(self, field):
         if field:
@@ -22,14 +84,12 @@ class Fields:
     def _format_field(self, field):
         comment_leader = "\n        # "
         key, value, desc = field
-        if key.lower() not in SSH_SETTINGS:
-            warn('unknown SSH setting.', culprit=key)
-        key = SSH_SETTINGS.get(key.lower(), key)
-        if value is True:
-            value = 'yes'
-        elif value is False:
-            value = 'no'
-        text = "    {} {}".format(key, value)
+        prefix, known = KEYWORDS.get(key) or keyword(key)
+        if not known:
+            self.unknown[key] = None
+        if value is True or value is False:
+            value = YES_NO[value]
+        text = f"{prefix}{value}"
         if desc:
             if not isinstance(desc, list):
                 desc = [desc]
@@ -62,6 +122,8 @@ class Fields:
 
 # Attributes Class {{{1
 class Attributes:
+    __slots__ = ("attributes",)
+
     def __init__(self, attributes):
         # Copy attributes while converting to a simple dictionary.
         # It is important that we copy because attributes will be deleted in this
@@ -120,13 +182,176 @@ class Hosts:
         self.config_file = settings.ssh_config_file
         self.config_dir = settings.ssh_config_file.parent
         self.settings = settings
-        self.hosts = []
+        self.network = NetworkEntry.find(networks[0])
+        self.known_networks = NetworkEntry.known() | {DEFAULT_NETWORK_NAME}
         self.hosts_by_name = {}
+        self.search_terms = {}
+        self.writer = None
+        self.groups = None
+        self.unknown_settings = {}  # attribute name -> names of hosts using it
+        self.reporters = dict(
+            REPORTERS, unknown_setting=self._unknown_setting, fail=self._fail
+        )
+        self.diagnostics = None
+        self.context = self._context()
+        self.cache_file = cache_path(HOSTS_CACHE_DIR, self.context + ".cache")
+        self.cache = self._read_cache()
+        self.cache_used = {}
+        self.cache_hits = 0
+        self.identity_paths = {}
+        self.directories = DirectoryCache(
+            cache_path(DIRECTORY_CACHE_FILE)
+            if settings.cache_directory_listings else None
+        )
+
+    # _context() {{{2
+    # Everything other than the fields of an entry that affects how it renders.
+    def _context(self):
+        settings = self.settings
+        network = self.network
+        return digest(repr((
+            HOSTS_CACHE_VERSION,
+            __version__,
+            self.networks,
+            network.name() if network else None,
+            network.proxy if network else None,
+            sorted(self.known_networks),
+            self.proxy,
+            sorted(self.proxies.items()),
+            ports.available_ports,
+            locations.my_location,
+            str(self.config_dir),
+            settings.blocked_ports,
+            settings.discard_entries,
+            settings.blocked_port_warning,
+            settings.available_ciphers,
+            settings.available_macs,
+            settings.available_host_key_algorithms,
+            settings.available_kex_algorithms,
+        )))
+
+    # _cache_key() {{{2
+    def _cache_key(self, entry, fields):
+        attributes = [(k, v) for k, v in fields.items() if k[0:1] != "_"]
+        identities = []
+        for key, value in attributes:
+            if key.lower() == "identityfile":
+                if isinstance(value, tuple):
+                    value = value[0]
+                if is_str(value):
+                    value = [value]
+                identities = [
+                    self.directories.exists(self._identity_path(filename))
+                    for filename in value
+                ]
+        return digest(repr((
+            self.context, entry.__name__, attributes, identities
+        )))
+
+    # _read_cache() {{{2
+    # The entries are cached separately for each context so that changing
+    # networks does not discard the entries rendered for the others.  The
+    # modification time of the file is updated to show that it was used.
+    def _read_cache(self):
+        try:
+            with self.cache_file.open("rb") as f, gc_paused():
+                cache = pickle.load(f)
+            os.utime(self.cache_file)
+            return cache
+        except Exception:
+            # cache is missing, unreadable or stale; simply start over
+            return {}
+
+    # save_cache() {{{2
+    # Saves the entries rendered or used in this run, dropping all others, and
+    # removes the files of the contexts that have been used least recently.
+    def save_cache(self):
+        narrate(
+            f"host cache: {self.cache_hits} hits,",
+            f"{len(self.cache_used) - self.cache_hits} misses."
+        )
+        if self.cache_used.keys() != self.cache.keys():
+            save_cache(self.cache_file, pickle.dumps(self.cache_used))
+            self._prune_cache()
+        self.directories.save()
+
+    # _prune_cache() {{{2
+    # Keeps the files of the most recently used contexts, at least one for
+    # each network so that create --all-networks always finds its entries.
+    def _prune_cache(self):
+        keep = max(
+            HOSTS_CACHE_CONTEXTS, sum(1 for n in NetworkEntry.all_networks()) + 1
+        )
+        directory = self.cache_file.parent
+        try:
+            paths = [directory / name for name in os.listdir(directory)]
+            paths.sort(key=lambda path: path.stat().st_mtime_ns, reverse=True)
+            for path in paths[keep:]:
+                path.unlink()
+        except OSError as e:
+            log("cannot prune host cache:", os_error(e))
+
+    # _identity_path() {{{2
+    # the path to an identity file, many hosts share the same few files
+    def _identity_path(self, filename):
+        try:
+            return self.identity_paths[filename]
+        except KeyError:
+            path = self.identity_paths[filename] = to_path(self.config_dir, filename)
+            return path
+
+    # _report() {{{2
+    # Record a message, it is reported by process() along with the rendered
+    # entry, which may be taken from the cache.  The severity is used by the
+    # check command; problems that are expected on some networks are warnings.
+    def _report(self, kind, *args, severity="error", **kwargs):
+        self.messages.append((kind, severity, args, kwargs))
+
+    # collect() {{{2
+    # Gather the messages as diagnostics rather than reporting them.  Each is a
+    # tuple of severity, culprit and message.
+    def collect(self):
+        self.diagnostics = []
+
+    # _diagnose() {{{2
+    def _diagnose(self, kind, severity, args, kwargs):
+        if kind == "unknown_setting":
+            key, name = args
+            culprit, message = name, f"unknown SSH setting: {key}"
+        else:
+            culprit = kwargs.get("culprit")
+            message = " ".join(str(arg) for arg in args).rstrip(".")
+        self.diagnostics.append((severity, culprit, message))
+
+    # _fail() {{{2
+    # An error in an entry, raised as the entry is output so the SSH config
+    # file is not written.
+    @staticmethod
+    def _fail(*args, **kwargs):
+        raise Error(*args, **kwargs)
+
+    # _unknown_setting() {{{2
+    # Note an attribute that is not an SSH setting, they are reported together
+    # by report_unknown_settings() as a typo in a base class affects many hosts.
+    def _unknown_setting(self, key, name):
+        self.unknown_settings.setdefault(key, {})[name] = None
+
+    # report_unknown_settings() {{{2
+    def report_unknown_settings(self):
+        for key, names in self.unknown_settings.items():
+            count = len(names)
+            warn(
+                f"unknown SSH setting, used by {count}",
+                "host:" if count == 1 else "hosts:",
+                full_stop(abbreviate_names(names, MAX_LISTED_HOSTS)),
+                culprit = key
+            )
+        self.unknown_settings = {}
 
-    def _append(self, name, fields, aliases=None, desc=None, guests=None):
+    def _append(self, name, fields, aliases, desc, guests, terms):
         # process primary host
-        names_as_list = [name] + (aliases if aliases else [])
-        names = " ".join(names_as_list)
+        names_as_tuple = tuple(intern(n) for n in [name] + aliases)
+        names = " ".join(names_as_tuple)
         if desc:
             lines = desc.strip().splitlines()
             lines = [f"{lines[0]}  {fold(2)}"] + lines[1:]
@@ -135,77 +360,154 @@ class Hosts:
             desc = f"# {names}  {fold(2)}"
         header = f"{desc}\nhost {names}"
         host = "\n".join([header] + fields.render_host())
-        self.hosts.append(host)
-        for name in names_as_list:
-            self.hosts_by_name[name] = host
+        self.blocks.append(Block(names_as_tuple, host, terms))
+        name = names_as_tuple[-1]
 
         # process guests
         for guest in guests:
             key, guestname, desc = guest
-            fullname = "-".join([name, guestname])
+            fullname = intern("-".join([name, guestname]))
             if desc:
                 header = "# {}\nhost {}".format(desc, fullname)
             else:
                 header = "host {}".format(fullname)
             host = "\n".join([header] + fields.render_guest(guestname, name))
-            self.hosts.append(host)
-            self.hosts_by_name[fullname] = host
-
-    def process(self, entry, forwards):
-        fields = Fields()
-
-        # Get fields
-        attributes = Attributes(entry.fields())
+            hostnames, descriptions, users, ports = terms
+            guest_terms = (
+                (intern(guestname),), (desc,) if desc else (), users, ()
+            )
+            self.blocks.append(Block((fullname,), host, guest_terms))
+
+    # process() {{{2
+    # Render the entry and its forwarding version, or take them from the cache
+    # if nothing has changed.  If wanted is given, only the version that
+    # produces the entry with that name is kept and its messages reported.
+    def process(self, entry, wanted=None):
+        self.add(*self.render_entry(entry), wanted)
+
+    # render_entry() {{{2
+    # Returns the cache key of the entry, its rendered versions, whether they
+    # were taken from the cache, and its group.  Nothing is reported or output.
+    def render_entry(self, entry):
+        fields = entry.fields()
+        key = self._cache_key(entry, fields)
+        group = self._group(entry)
+        rendered = self.cache.get(key)
+        if rendered is not None:
+            return key, rendered, True, group
+        self.versions = []
+        self._process(entry, fields)
+        return key, self.versions, False, group
+
+    # _group() {{{2
+    # The group of an entry is given by the group attribute of the entry or
+    # its nearest ancestor, otherwise it is the name of its top-level
+    # ancestor.  The group attribute is not inherited like the other fields,
+    # so the ancestors are searched here.  Used as the name of a file, so
+    # characters other than letters, digits, dashes and underscores are
+    # replaced.
+    @staticmethod
+    def _group(entry):
+        group = None
+        for cls in entry.__mro__:
+            if cls is HostEntry or group:
+                break
+            top = cls
+            for key, value in cls.__dict__.items():
+                if key.lower() == "group":
+                    group = value[0] if isinstance(value, tuple) else value
+        return re.sub(r"[^\w-]", "_", str(group or top.__name__).lower())
+
+    # add() {{{2
+    # Report the messages and output the versions of a rendered entry.
+    def add(self, key, rendered, cached, group, wanted=None):
+        if cached:
+            self.cache_hits += 1
+        self.cache_used[key] = rendered
+
+        for names, blocks, messages in rendered:
+            if wanted and wanted not in names:
+                continue
+            for kind, severity, args, kwargs in messages:
+                if self.diagnostics is None:
+                    self.reporters[kind](*args, **kwargs)
+                else:
+                    self._diagnose(kind, severity, args, kwargs)
+            for block in blocks:
+                if self.groups is not None:
+                    self.groups.setdefault(group, []).append(block.text)
+                elif self.writer:
+                    self.writer.write(self.separator + block.text)
+                    self.separator = "\n\n"
+                else:
+                    for name in block.names:
+                        self.hosts_by_name[name] = block.text
+                for name in block.names:
+                    self.search_terms[name] = block.terms
+
+    # stream() {{{2
+    # Write the entries to writer as they are processed rather than keeping
+    # them.  Each is preceded by a newline and followed by a blank line.
+    def stream(self, writer):
+        self.writer = writer
+        self.separator = "\n"
+
+    # shard() {{{2
+    # Collect the entries by group rather than keeping or writing them.
+    # groups maps the name of each group to the text of its entries, in the
+    # order of first appearance.  The text is shared with the cache.
+    def shard(self):
+        self.groups = {}
+
+    # _process() {{{2
+    # Render both the plain entry and, if the host has port forwards, the
+    # forwarding (-tun) entry.  The attributes are examined once and shared by
+    # both; only the name, description, aliases and forwards differ.
+    def _process(self, entry, fields):
+        attributes = Attributes(fields)
         name = entry.__name__.lower()
-        proxyCommand = attributes.get('proxyCommand')
-        forwarding = False
+        host = dict(name=name)
 
-        # Return if this is forwarding version and there are no forwards
-        if forwards:
-            if (
-                "localForward" not in attributes
-                and "remoteForward" not in attributes
-                and "dynamicForward" not in attributes
-            ):
-                return
-            name = "%s-tun" % name
-        else:
-            # Not interested in forwards, so remove them
-            attributes.remove("localForward")
-            attributes.remove("remoteForward")
-            attributes.remove("dynamicForward")
+        # Get fields
+        host['proxyCommand'] = attributes.get('proxyCommand')
+
+        # Group, only used to choose the file that holds the entry
+        attributes.remove("group")
+
+        # Port forwards, only included in the forwarding version
+        host['has_forwards'] = (
+            "localForward" in attributes
+            or "remoteForward" in attributes
+            or "dynamicForward" in attributes
+        )
+        forwards = []
+        for attribute in attributes.getall("localForward"):
+            forwards.append((attribute, False))
+        for attribute in attributes.getall("remoteForward"):
+            forwards.append((attribute, False))
+        attribute = attributes.get("dynamicForward")
+        if attribute:
+            forwards.append((attribute, True))
+        host['forwards'] = forwards
 
         # Host description
         attribute = attributes.get("description")
-        if attribute:
-            key, value, desc = attribute
-            description = (value + " (with port forwards)") if forwards else value
-        else:
-            description = None
+        host['description'] = attribute[1] if attribute else None
 
         # Aliases
-        aliases = [
-            val + ("-tun" if forwards else "")
-            for key, val, desc in attributes.getall("aliases")
-        ]
+        host['aliases'] = [val for key, val, desc in attributes.getall("aliases")]
 
         # User
-        fields.append(attributes.get("user"))
+        attribute = attributes.get("user")
+        host['user'] = attribute
 
         # Hostname
         attribute = attributes.get("hostname")
+        unknown_networks = None
         if attribute:
             key, hostnames, desc = attribute
             if isinstance(hostnames, dict):
-                unknown_networks = set(hostnames.keys()) - set(
-                    list(NetworkEntry.known()) + [DEFAULT_NETWORK_NAME]
-                )
-                if unknown_networks:
-                    display(
-                        "{}: uses unknown networks: {}".format(
-                            name, ", ".join(sorted(unknown_networks))
-                        )
-                    )
+                unknown_networks = hostnames.keys() - self.known_networks
                 for hn in hostnames:
                     if hn in self.networks:
                         hostname = hostnames[hn]
@@ -216,44 +518,49 @@ class Hosts:
                     if DEFAULT_NETWORK_NAME in hostnames:
                         hostname = hostnames[DEFAULT_NETWORK_NAME]
                     else:
-                        return
+                        hostname = None
                 attribute = key, hostname, desc
+                all_hostnames = tuple(intern(str(h)) for h in hostnames.values())
             else:
                 hostname = hostnames
                 hostnames = {}
-            fields.append(attribute)
+                all_hostnames = (intern(str(hostname)),)
         else:
             hostname = "%h"
             hostnames = {}
+            all_hostnames = ()
+        host.update(
+            hostname_field=attribute, hostname=hostname,
+            unknown_networks=unknown_networks, all_hostnames=all_hostnames
+        )
 
         # Port
         attribute = attributes.get("port")
         if attribute:
             key, port, desc = attribute
-            fields.append(attribute)
             n_port = int(port)
+            all_ports = (intern(str(port)),)
         else:
             port = "%p"
             n_port = 22
-        if n_port in self.settings.blocked_ports and not proxyCommand:
-            if 'without_ports' in self.settings.discard_entries:
-                log(f'discarded because port {n_port} is blocked.', culprit=name)
-                return
-            if self.settings.blocked_port_warning:
-                warn(f'port {n_port} is not available.', culprit=name)
+            all_ports = ()
+        host.update(port_field=attribute, n_port=n_port, all_ports=all_ports)
+        host['blocked'] = (
+            n_port in self.settings.blocked_ports and not host['proxyCommand']
+        )
 
         # IdentityFile and IdentitiesOnly
         attribute = attributes.get("identityFile")
+        identities = None
         if attribute:
             key, value, desc = attribute
-            file_found = False
+            identities = []
             if is_str(value):
                 value = [value]
             for filename in value:
-                filepath = to_path(self.config_dir, filename)
-                if filepath.exists():
-                    file_found = True
-                    fields.append((key, filepath, desc))
+                filepath = self._identity_path(filename)
+                if self.directories.exists(filepath):
+                    identities.append((key, filepath, desc))
                         # Do not use filepath because it includes the config_dir
                         # and so is an absolute path. That prevents the
                         # generated config file from being copied to another
@@ -265,14 +572,10 @@ class Hosts:
                         # it needs absolute paths in the config file.  Relative
                         # paths are relative to the directory where ssh is
                         # invoked and not relative to the config file itself.
-            if file_found:
-                fields.append(('identitiesOnly', 'yes', None))
-                fields.append(("pubkeyAuthentication", "yes", None))
-            else:
-                if 'without_identities' in self.settings.discard_entries:
-                    log('discarded because identity file was not found.', culprit=name)
-                    return
-                warn('no identity files found.', culprit=name)
+            if identities:
+                identities.append(('identitiesOnly', 'yes', None))
+                identities.append(("pubkeyAuthentication", "yes", None))
+        host['identities'] = identities
 
         # ForwardAgent
         attribute = attributes.get("trusted")
@@ -280,41 +583,149 @@ class Hosts:
             key, trusted, desc = attribute
         else:
             trusted = False
-        fields.append(("forwardAgent", trusted, None))
+        host['trusted'] = trusted
         # fields.append(('forwardX11', 'no' if trusted else 'no', None))
 
-        # LocalForwards
-        for attribute in attributes.getall("localForward"):
-            check_forward(attribute)
-            fields.append(attribute)
-            forwarding = True
+        # ProxyCommand
+        network = self.network
+        network_proxy = network.proxy if network else None
+        host['global_proxy'] = (
+            not host['proxyCommand']
+            and self.proxy
+            and not (
+                self.proxy == name
+                or ((self.proxy == network_proxy) and (network.name() in hostnames))
+            )
+        )
+        host['proxy'] = self.proxies.get(
+            self.proxy,
+            "ssh {} -W {}:{}".format(self.proxy, hostname, port)
+            # on old centos servers this is 'ssh {} nc {} 22'
+        )
 
-        # RemoteForwards
-        for attribute in attributes.getall("remoteForward"):
-            check_forward(attribute)
-            fields.append(attribute)
-            forwarding = True
+        # SSH algorithms
+        algorithms = []
 
-        # DynamicForward
-        attribute = attributes.get("dynamicForward")
-        if attribute:
-            check_forward(attribute, True)
-            fields.append(attribute)
-            forwarding = True
+        def add_algorithms(name, available):
+            if available:
+                attribute = attributes.get(name)
+                if attribute:
+                    key, value, desc = attribute
+                    values = value.split(',')
+                    values = [v for v in values if v in available]
+                    algorithms.append((key, ','.join(values), desc))
+
+        add_algorithms("ciphers", self.settings.available_ciphers)
+        add_algorithms("macs", self.settings.available_macs)
+        add_algorithms("hostkeyalgorithms", self.settings.available_host_key_algorithms)
+        add_algorithms("kexalgorithms", self.settings.available_kex_algorithms)
+        host['algorithms'] = algorithms
+
+        # Any unknown attributes
+        host['remaining'] = list(attributes.remaining())
+
+        # Guests (hosts that use this host as a proxy)
+        host['guests'] = list(attributes.getall("guests"))
+
+        # Save host
+        for forwards in [False, True] if host['has_forwards'] else [False]:
+            self.blocks = []
+            self.messages = []
+            self._emit(host, forwards)
+            names = {n for block in self.blocks for n in block.names}
+            names.update(self.names)
+            self.versions.append(
+                (tuple(names), tuple(self.blocks), tuple(self.messages))
+            )
+
+    # _emit() {{{2
+    # Render one version of a host from the attributes gathered by _process().
+    def _emit(self, host, forwards):
+        fields = Fields()
+        name = host['name'] + ("-tun" if forwards else "")
 
-        # ExitOnForwardFailure
-        if forwarding:
-            fields.append(("exitOnForwardFailure", "yes", None))
+        # Host description
+        description = host['description']
+        if description and forwards:
+            description += " (with port forwards)"
+
+        # Aliases
+        aliases = [
+            alias + ("-tun" if forwards else "") for alias in host['aliases']
+        ]
+        self.names = [name] + aliases
+
+        # User
+        attribute = host['user']
+        fields.append(attribute)
+        user = (intern(str(attribute[1])),) if attribute else ()
+
+        # Hostname
+        if host['unknown_networks']:
+            self._report(
+                'display',
+                "uses unknown networks:",
+                ", ".join(sorted(host['unknown_networks'])),
+                culprit = name
+            )
+        if host['hostname'] is None:
+            return
+        fields.append(host['hostname_field'])
+
+        # Port
+        fields.append(host['port_field'])
+        n_port = host['n_port']
+        if host['blocked']:
+            if 'without_ports' in self.settings.discard_entries:
+                self._report(
+                    'log', f'discarded because port {n_port} is blocked.',
+                    culprit=name, severity="warning"
+                )
+                return
+            self._report(
+                'warn' if self.settings.blocked_port_warning else 'log',
+                f'port {n_port} is not available.',
+                culprit=name, severity="warning"
+            )
+
+        # IdentityFile and IdentitiesOnly
+        identities = host['identities']
+        if identities:
+            for attribute in identities:
+                fields.append(attribute)
+        elif identities is not None:
+            if 'without_identities' in self.settings.discard_entries:
+                self._report(
+                    'log',
+                    'discarded because identity file was not found.',
+                    culprit=name
+                )
+                return
+            self._report('warn', 'no identity files found.', culprit=name)
+
+        # ForwardAgent
+        fields.append(("forwardAgent", host['trusted'], None))
+
+        # LocalForwards, RemoteForwards and DynamicForward
+        if forwards:
+            for attribute, dynamic in host['forwards']:
+                try:
+                    check_forward(attribute, dynamic)
+                except Error as e:
+                    # recorded so the other problems of the host are also
+                    # found by check
+                    self._report('fail', e.get_message(), culprit=name)
+                    continue
+                fields.append(attribute)
+
+            # ExitOnForwardFailure
+            if host['forwards']:
+                fields.append(("exitOnForwardFailure", "yes", None))
 
         # ProxyCommand
-        network = NetworkEntry.find(self.networks[0])
-        network_proxy = network.proxy if network else None
-        if proxyCommand:
-            fields.append(proxyCommand)
-        elif self.proxy and not (
-            self.proxy == entry.__name__.lower()
-            or ((self.proxy == network_proxy) and (network.name() in hostnames))
-        ):
+        if host['proxyCommand']:
+            fields.append(host['proxyCommand'])
+        elif host['global_proxy']:
             # This host does not have a ProxyCommand entry, add it if a global
             # proxy is requested unless this host is the itself the proxy or if
             # this host is on the same network as the proxy.
@@ -322,52 +733,56 @@ class Hosts:
             # a network for which this host is specifically configured.  That
             # generally indicates that there is a direct path to this host on
             # this network and the proxy is not needed.
-
-            assert hostname
-            assert port
             fields.append(
                 (
                     "proxyCommand",
-                    self.proxies.get(
-                        self.proxy,
-                        "ssh {} -W {}:{}".format(self.proxy, hostname, port)
-                        # on old centos servers this is 'ssh {} nc {} 22'
-                    ),
+                    host['proxy'],
                     "Use %s as global proxy to access %s" % (self.proxy, name),
                 )
             )
 
         # SSH algorithms
-        def add_algorithms(name, available):
-            if available:
-                attribute = attributes.get(name)
-                if attribute:
-                    key, value, desc = attribute
-                    values = value.split(',')
-                    values = [v for v in values if v in available]
-                    fields.append((key, ','.join(values), desc))
-
-        add_algorithms("ciphers", self.settings.available_ciphers)
-        add_algorithms("macs", self.settings.available_macs)
-        add_algorithms("hostkeyalgorithms", self.settings.available_host_key_algorithms)
-        add_algorithms("kexalgorithms", self.settings.available_kex_algorithms)
+        for attribute in host['algorithms']:
+            fields.append(attribute)
 
         # Output any unknown attributes
-        for attribute in attributes.remaining():
+        for attribute in host['remaining']:
             fields.append(attribute)
 
         # Guests (hosts that use this host as a proxy)
-        guests = [] if forwards else attributes.getall("guests")
+        guests = [] if forwards else host['guests']
 
-        # Save host
-        self._append(name, fields, aliases, description, guests)
+        # Terms used when searching for the host
+        terms = (
+            host['all_hostnames'],
+            (description,) if description else (),
+            user,
+            host['all_ports'],
+        )
 
-    def output(self):
-        return "\n\n".join(self.hosts)
+        # Save host
+        self._append(name, fields, aliases, description, guests, terms)
+        for key in fields.unknown:
+            self._report('unknown_setting', key, name)
+
+    # render() {{{2
+    # Returns the named SSH host entry, processing only the host needed.
+    # The name may be a host name or alias, with or without a -tun suffix, or
+    # the name of a guest (host-guest).
+    def render(self, name):
+        candidates = [name] + [name[:i] for i, c in enumerate(name) if c == "-"]
+        for base in candidates:
+            entry = HostEntry.find(base)
+            if entry:
+                self.process(entry, name)
+                if name in self.hosts_by_name:
+                    return self.hosts_by_name[name]
+        return None
 
 
 # check_forward {{{1
-# Attribute is an SSH port forward, assure it has correct syntax
+# Attribute is an SSH port forward, assure it has correct syntax, raises Error
+# if not
 re_ipaddr = r"(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})"
 re_hostname = r"(([a-z][\w-]*\.)*[\w-]*[a-z])"
 re_asterix = r"(\*)"
@@ -384,10 +799,10 @@ def check_forward(attribute, dynamic=False):
         # address may be hostname, ip address, or *.
         forward = str(attribute[1])
         if not forward_pattern.match(forward):
-            exit("Invalid dynamic forward: %s" % attribute[1])
+            raise Error("invalid dynamic forward:", attribute[1])
     else:
         forwards = attribute[1].split()
         if len(forwards) != 2 or not all(
             [bool(forward_pattern.match(each)) for each in forwards]
         ):
-            exit("Invalid forward: %s" % attribute[1])
+            raise Error("invalid forward:", attribute[1])
@@ -14,6 +14,9 @@ Options:
     -p PORTS, --ports PORTS           specifies list of available ports
     -P NAME, --proxy NAME             specifies the global proxy
     -q, --quiet                       suppress optional output
+    -v, --verbose                     narrate the actions taken
+    -t, --timings                     report the time taken by each phase
+    --timings-json FILE               write the timings to FILE as JSON
 
 Specify the list of available ports as a comma separated list (no spaces). For
 example, --ports=80,443.
@@ -45,31 +48,31 @@ Run 'sshconfig available' to see available choices for proxies, locations, and n
 # Imports {{{1
 from docopt import docopt
 
-from inform import Error, Inform, display, done, fatal, os_error
-from shlib import set_prefs as shlib_set_prefs
-from shlib import to_path
+from inform import Error, Inform, display, done, fatal, os_error, terminate
+from pathlib import Path
 
 from . import __released__, __version__
-from .command import Command
+from . import timings
 from .preferences import CONFIG_DIR, DATA_DIR, LOG_FILE
-from .settings import Settings
 
-shlib_set_prefs(use_inform=True)
+# the commands, and the settings they require, are imported only once the
+# command line has been read, to keep commands such as version and help fast
 
 
 # Globals {{{1
-synopsis = __doc__.format(commands=Command.summarize())
+synopsis = __doc__
 version = f"{__version__} ({__released__})"
 
 
 # Main {{{1
 def main():
     with Inform(notify_if_no_tty=True, version=version) as inform:
+        exit_status = 0
         try:
             # assure config and log directories exist
-            to_path(CONFIG_DIR).mkdir(parents=True, exist_ok=True)
-            to_path(DATA_DIR).mkdir(parents=True, exist_ok=True)
-            inform.set_logfile(to_path(DATA_DIR, LOG_FILE))
+            Path(CONFIG_DIR).mkdir(parents=True, exist_ok=True)
+            Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
+            inform.set_logfile(Path(DATA_DIR, LOG_FILE))
 
             # read command line
             cmdline = docopt(synopsis, options_first=True, version=version)
@@ -77,11 +80,33 @@ def main():
             args = cmdline["<args>"]
             if cmdline["--quiet"]:
                 inform.quiet = True
+            if cmdline["--verbose"]:
+                inform.narrate = True
+            if cmdline["--timings"] or cmdline["--timings-json"]:
+                timings.enable()
 
             # find and run command
-            settings = Settings(cmdline)
+            from .command import Command
+
             cmd, cmd_name = Command.find(command)
-            cmd.execute(cmd_name, args, settings, cmdline)
+            settings = None
+            if cmd.REQUIRES_SETTINGS:
+                from .settings import Settings
+
+                with timings.phase("settings"):
+                    settings = Settings(cmdline)
+            with timings.phase(cmd_name):
+                exit_status = cmd.execute(cmd_name, args, settings, cmdline)
+            if settings:
+                from .python import PythonFile
+
+                PythonFile.report_cache_stats()
+
+            # report timings
+            if cmdline["--timings"]:
+                timings.report()
+            if cmdline["--timings-json"]:
+                timings.save(cmdline["--timings-json"])
 
         except KeyboardInterrupt:
             display("Terminated by user.")
@@ -89,4 +114,6 @@ def main():
             e.terminate()
         except OSError as e:
             fatal(os_error(e))
+        if exit_status:
+            terminate(exit_status)
         done()
@@ -0,0 +1,243 @@
+# Neighbors
+#
+# Reads the MAC addresses of the neighboring devices directly from the kernel's
+# neighbor table rather than running 'ip neighbor' or 'arp', and watches for
+# changes in the network configuration.
+
+# License {{{1
+# Copyright (C) 2018-2023 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see http://www.gnu.org/licenses.
+
+
+# Imports {{{1
+import errno
+import os
+import select
+import socket
+import struct
+import time
+
+from inform import Error, log, os_error
+
+from .utilities import normalize_mac
+
+# Globals {{{1
+PROC_ARP = "/proc/net/arp"
+PROC_ROUTE = "/proc/net/route"
+ATF_COM = 0x02  # entry is complete
+
+# rtnetlink constants, see rtnetlink(7) and linux/neighbour.h
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+NLM_F_REQUEST = 0x001
+NLM_F_DUMP = 0x300
+NDA_LLADDR = 2
+NUD_INCOMPLETE = 0x01
+NUD_FAILED = 0x20
+NUD_NOARP = 0x40
+NUD_USABLE = 0xFF & ~(NUD_INCOMPLETE | NUD_FAILED | NUD_NOARP)
+NLMSGHDR = struct.Struct("=IHHII")  # length, type, flags, sequence, pid
+NDMSG = struct.Struct("=BxxxiHBB")  # family, ifindex, state, flags, type
+RTATTR = struct.Struct("=HH")  # length, type
+
+# rtnetlink multicast groups, see linux/rtnetlink.h
+RTMGRP_LINK = 0x001
+RTMGRP_NEIGH = 0x004
+RTMGRP_IPV4_IFADDR = 0x010
+RTMGRP_IPV4_ROUTE = 0x040
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+RTMGRP_NETWORK = (
+    RTMGRP_LINK | RTMGRP_NEIGH | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE |
+    RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE
+)
+
+
+# parse_proc_arp {{{1
+def parse_proc_arp(text):
+    """Yields the normalized MAC addresses found in the text of /proc/net/arp.
+
+    The contents may be given as text or bytes.  Incomplete entries are
+    skipped.
+    """
+    if isinstance(text, bytes):
+        text = text.decode("ascii", errors="replace")
+    for row in text.splitlines()[1:]:
+        try:
+            ip, hw_type, flags, mac = row.split()[:4]
+            if not int(flags, 16) & ATF_COM:
+                continue
+            yield normalize_mac(mac)
+        except ValueError:
+            continue
+
+
+# parse_neighbor_messages {{{1
+def parse_neighbor_messages(data):
+    """Yields the normalized MAC addresses found in rtnetlink neighbor messages.
+
+    Incomplete, failed and static non-ARP entries are skipped, as they are by
+    'ip neighbor'.  Yields None when the end of the dump is reached.
+    """
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, kind, flags, seq, pid = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        if kind == NLMSG_DONE:
+            yield None
+            return
+        if kind == NLMSG_ERROR:
+            code = -struct.unpack_from("=i", data, offset + NLMSGHDR.size)[0]
+            raise Error(os.strerror(code), culprit="rtnetlink")
+        if kind == RTM_NEWNEIGH:
+            start = offset + NLMSGHDR.size
+            family, index, state, nd_flags, nd_type = NDMSG.unpack_from(data, start)
+            if state & NUD_USABLE:
+                attr = start + NDMSG.size
+                while attr + RTATTR.size <= offset + length:
+                    attr_len, attr_type = RTATTR.unpack_from(data, attr)
+                    if attr_len < RTATTR.size:
+                        break
+                    value = data[attr + RTATTR.size:attr + attr_len]
+                    if attr_type == NDA_LLADDR and len(value) == 6:
+                        yield ":".join("%x" % b for b in value)
+                    attr += (attr_len + 3) & ~3
+        offset += (length + 3) & ~3
+
+
+# read_netlink {{{1
+def read_netlink():
+    "Returns the MAC addresses in the neighbor table, as read with rtnetlink."
+    request = NLMSGHDR.pack(
+        NLMSGHDR.size + NDMSG.size, RTM_GETNEIGH, NLM_F_REQUEST | NLM_F_DUMP, 1, 0
+    ) + NDMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+    macs = []
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+        sock.sendall(request)
+        while True:
+            for mac in parse_neighbor_messages(sock.recv(65536)):
+                if mac is None:
+                    return macs
+                macs.append(mac)
+
+
+# get_neighbor_macs {{{1
+def get_neighbor_macs(source="auto"):
+    """Returns the MAC addresses of the neighboring devices.
+
+    source (str):
+        Either 'proc', in which case /proc/net/arp is read, 'netlink', in
+        which case the neighbor table is dumped using an rtnetlink socket, or
+        'auto', in which case rtnetlink is used if possible and /proc/net/arp
+        otherwise.  /proc/net/arp only contains IPv4 neighbors.
+    """
+    if source == "auto":
+        if hasattr(socket, "AF_NETLINK"):
+            try:
+                return read_netlink()
+            except OSError as e:
+                log(f"cannot read neighbors using rtnetlink: {os_error(e)}")
+        source = "proc"
+    if source == "netlink" and not hasattr(socket, "AF_NETLINK"):
+        raise Error("rtnetlink is not available on this platform.")
+    try:
+        if source == "netlink":
+            return read_netlink()
+        if source == "proc":
+            with open(PROC_ARP) as f:
+                return list(parse_proc_arp(f.read()))
+    except OSError as e:
+        raise Error(os_error(e))
+    raise Error("unknown source for router MACs.", culprit=source)
+
+
+# NetworkMonitor class {{{1
+class NetworkMonitor:
+    """Watches for changes in the links, addresses, routes and neighbors.
+
+    Subscribes to the rtnetlink multicast groups if possible, otherwise polls
+    /proc/net/route and /proc/net/arp and compares their contents.
+    """
+
+    def __init__(self):
+        self.sock = None
+        if hasattr(socket, "AF_NETLINK"):
+            try:
+                self.sock = socket.socket(
+                    socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE
+                )
+                self.sock.bind((0, RTMGRP_NETWORK))
+                self.sock.setblocking(False)
+            except OSError:
+                self.close()
+        self.tables = self.read_tables()
+
+    # read_tables() {{{2
+    # returns the contents of the route and neighbor tables, used when polling
+    @staticmethod
+    def read_tables():
+        tables = []
+        for path in [PROC_ROUTE, PROC_ARP]:
+            try:
+                with open(path) as f:
+                    tables.append(f.read())
+            except OSError:
+                tables.append(None)
+        return tables
+
+    # wait() {{{2
+    def wait(self, timeout):
+        """Waits for a change in the network configuration.
+
+        Returns True if a change occurred within timeout seconds, otherwise
+        returns False.  Any pending notifications are consumed.  If the
+        notifications overflow the buffer of the socket, some are lost, but
+        there was a change.  On any other error the tables are polled instead.
+        """
+        if self.sock:
+            readable, _, _ = select.select([self.sock], [], [], timeout)
+            if not readable:
+                return False
+            while True:
+                try:
+                    if not self.sock.recv(65536):
+                        break
+                except BlockingIOError:
+                    break
+                except OSError as e:
+                    if e.errno == errno.ENOBUFS:
+                        continue
+                    log("netlink failed, polling instead:", os_error(e))
+                    self.close()
+                    self.tables = self.read_tables()
+                    break
+            return True
+
+        time.sleep(timeout)
+        tables = self.read_tables()
+        if tables != self.tables:
+            self.tables = tables
+            return True
+        return False
+
+    # close() {{{2
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
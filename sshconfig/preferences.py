@@ -26,18 +26,28 @@ PROGRAM_NAME = "sshconfig"
 DEFAULT_COMMAND = "create"
 ENCODING = "utf-8"
 INDENT = "    "
-ROUTER_MACS = dict(style='ip', executable='/sbin/ip neighbor')
+ROUTER_MACS = dict(style='native')
     # other choices:
+    #     dict(style='native', source='proc')
+    #     dict(style='ip', executable='/sbin/ip neighbor')
     #     dict(style='custom', executable='/sbin/arp -e', column=3)
     #     dict(style='custom', executable='/sbin/arp -a', column=4)
     # 'arp' is a synonym for 'custom', default column is 1
 NMCLI_CONNS = None
     # use con rather than connection for compatibility with centos6
+PROBE_TIMEOUT = 2
+    # seconds allowed for each network probe (router MACs, nmcli)
 UNKNOWN_NETWORK_NAME = "unknown"
 DEFAULT_NETWORK_NAME = "default"
 DATE_FORMAT = "H:mm A on D MMMM YYYY"
+SLOWEST_HOSTS = 10
+    # number of hosts listed by --timings
 DISCARD_ENTRIES = []
     # supported choices: 'without_identities', 'without_ports'
+CACHE_DIRECTORY_LISTINGS = False
+    # keep the directory listings used to find identity files between runs
+SHARD_HOSTS = False
+    # write the host entries into a file for each group, see SHARDS_SUFFIX
 
 def fold(level):
     return 3*'{' + str(level)
@@ -47,7 +57,17 @@ def fold(level):
 CONFIG_DIR = user_config_dir(PROGRAM_NAME)
 DATA_DIR = user_data_dir(PROGRAM_NAME)
 LOG_FILE = "sshconfig.log"
+CACHE_DIR = "cache"
+MANIFEST_FILE = "create.manifest"
+HOSTS_CACHE_DIR = "hosts"  # a file of rendered host entries for each context
+HOSTS_CACHE_CONTEXTS = 8  # at least, one is also kept for each network
+SSH_QUERIES_FILE = "ssh.queries"
+DIRECTORY_CACHE_FILE = "directories.cache"
+NETWORK_CONFIGS_DIR = "networks"  # SSH config files pre-generated per network
 SSH_CONFIG_FILE = "~/.ssh/config"
+SEARCH_INDEX_SUFFIX = ".index"
+SHARDS_SUFFIX = ".sshconfig.d"  # host entry files, next to the config file
+SHARD_SUFFIX = ".conf"
 
 # Config file components {{{2
 SSH_HEADER = dedent(
@@ -65,6 +85,19 @@ SSH_HEADER = dedent(
     """
 ).strip()
 
+SSH_SHARD_HEADER = dedent(
+    """
+    # SSH Configuration for the {group} hosts
+    #
+    # DO NOT EDIT THIS FILE
+    #
+    # It is automatically generated by sshconfig and included by {config_file!s}.
+    # To make changes in this file, edit files in {config_dir!s} and run:
+    #
+    #     sshconfig create
+    """
+).strip()
+
 SSH_DEFAULTS = dedent(
     """
     # GLOBAL DEFAULTS  {fold}
@@ -21,13 +21,21 @@
 
 
 # Imports {{{1
-from inform import Error, display, full_stop, narrate, os_error
+import marshal
+from importlib.util import MAGIC_NUMBER
+
+from inform import Error, display, full_stop, log, narrate, os_error
 from shlib import cp, to_path
 
+from .cache import cache_path, digest, save_cache
+
 
 # PythonFile class {{{1
 class PythonFile:
     ActivePythonFile = None
+    cache_hits = 0
+    cache_misses = 0
+    compiled = {}  # path -> (key, code), retained for the life of the process
 
     @classmethod
     def get_active_python_file(cls):
@@ -66,16 +74,42 @@ class PythonFile:
         "Restores the backup copy of the file."
         cp(self.backup_path, self.path)
 
-    def run(self):
-        self.ActivePythonFile = self.path
+    def compile(self):
+        """Returns the code object for the file.
+
+        Compiled code is cached in the data directory.  It is keyed by the path,
+        size, modification time and contents of the file, along with the
+        version of the Python byte code, and is only recompiled when one of
+        those changes.
+        """
         path = self.path
-        narrate("reading:", path)
         try:
+            stat = path.stat()
             self.code = self.read()
             # need to save the code for the new command
         except OSError as err:
             raise Error(os_error(err))
-
+        key = (str(path), stat.st_size, stat.st_mtime_ns, digest(self.code))
+        cache = cache_path(f"{path.name}.{digest(str(path))[:16]}.pyc")
+
+        # try the caches
+        key_and_code = PythonFile.compiled.get(str(path))
+        if key_and_code and key_and_code[0] == key:
+            PythonFile.cache_hits += 1
+            return key_and_code[1]
+        try:
+            with cache.open("rb") as f:
+                if f.read(len(MAGIC_NUMBER)) == MAGIC_NUMBER:
+                    if marshal.load(f) == key:
+                        compiled = marshal.load(f)
+                        PythonFile.cache_hits += 1
+                        PythonFile.compiled[str(path)] = (key, compiled)
+                        return compiled
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        PythonFile.cache_misses += 1
+
+        # compile the code
         try:
             compiled = compile(self.code, str(path), "exec")
         except SyntaxError as err:
@@ -91,6 +125,25 @@ class PythonFile:
                     sep="\n",
                 )
 
+        # update the cache
+        log("caching:", path)
+        save_cache(cache, MAGIC_NUMBER + marshal.dumps(key) + marshal.dumps(compiled))
+        PythonFile.compiled[str(path)] = (key, compiled)
+        return compiled
+
+    @classmethod
+    def report_cache_stats(cls):
+        if cls.cache_hits or cls.cache_misses:
+            narrate(
+                f"compiled code cache: {cls.cache_hits} hits, {cls.cache_misses} misses."
+            )
+
+    def run(self):
+        self.ActivePythonFile = self.path
+        path = self.path
+        narrate("reading:", path)
+        compiled = self.compile()
+
         contents = {}
         try:
             exec(compiled, contents)
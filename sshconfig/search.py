@@ -0,0 +1,146 @@
+# Search
+#
+# An index of the SSH host entries used by the find command.
+
+# License {{{1
+# Copyright (C) 2018-2023 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see http://www.gnu.org/licenses.
+
+
+# Imports {{{1
+import pickle
+import re
+
+from inform import Error, full_stop
+
+from .cache import save_cache
+from .utilities import gc_paused
+
+# Globals {{{1
+# change the version if the format of the index changes
+SEARCH_INDEX_VERSION = 2
+N = 3  # length of the n-grams
+
+
+# ngrams {{{1
+def ngrams(text):
+    return {text[i:i+N] for i in range(len(text) - N + 1)}
+
+
+# is_subsequence {{{1
+# the characters of text appear in order in term
+def is_subsequence(text, term):
+    chars = iter(term)
+    return all(c in chars for c in text)
+
+
+# SearchIndex class {{{1
+class SearchIndex:
+    """Index of SSH host entries.
+
+    Each entry is described by its name and a tuple that holds the remaining
+    fields (hostname, description, user, port), each a tuple of strings.  An
+    n-gram index over the lowercase terms narrows the entries that must be
+    examined when searching for a substring.
+    """
+    TERM_FIELDS = "hostname description user port".split()
+    FIELDS = ["name"] + TERM_FIELDS
+
+    def __init__(self, search_terms, stamp=None):
+        self.stamp = stamp
+        self.names = list(search_terms)
+        self.terms = []
+        self.grams = {}
+        with gc_paused():
+            for i, (name, terms) in enumerate(search_terms.items()):
+                terms = tuple(
+                    tuple(v.lower() for v in values)
+                    for values in ((name,),) + terms
+                )
+                self.terms.append(terms)
+                for values in terms:
+                    for value in values:
+                        for gram in ngrams(value):
+                            self.grams.setdefault(gram, set()).add(i)
+
+    # save() {{{2
+    def save(self, path):
+        save_cache(path, pickle.dumps((SEARCH_INDEX_VERSION, self)))
+
+    # load() {{{2
+    # returns the index if it exists and has the expected stamp, otherwise None
+    @staticmethod
+    def load(path, stamp):
+        try:
+            with path.open("rb") as f, gc_paused():
+                version, index = pickle.load(f)
+        except Exception:
+            return None
+        if version == SEARCH_INDEX_VERSION and index.stamp == stamp:
+            return index
+        return None
+
+    # search() {{{2
+    def search(self, text, mode="substring", fields=("name",)):
+        """Returns the names of the entries that match.
+
+        mode (str):
+            'substring' matches if text is found anywhere in a field,
+            'prefix' matches if a field starts with text,
+            'regex' matches if the regular expression text is found in a field,
+            'fuzzy' matches if the characters in text appear in order in a field.
+        fields (list of str):
+            The fields to search.
+
+        Matching is case insensitive.
+        """
+        if mode == "regex":
+            # the terms are lower case, but lowering the expression would
+            # change escapes such as \D into \d
+            try:
+                regex = re.compile(text, re.IGNORECASE)
+            except re.error as e:
+                raise Error(full_stop(e), culprit=text)
+            matches = regex.search
+        else:
+            text = text.lower()
+            if mode == "prefix":
+                matches = lambda term: term.startswith(text)
+            elif mode == "fuzzy":
+                matches = lambda term: is_subsequence(text, term)
+            else:
+                matches = lambda term: text in term
+
+        # use the n-grams to find the candidates
+        candidates = range(len(self.names))
+        if mode in ["substring", "prefix"] and len(text) >= N:
+            found = None
+            for gram in ngrams(text):
+                entries = self.grams.get(gram, set())
+                found = entries if found is None else found & entries
+                if not found:
+                    return []
+            candidates = sorted(found)
+
+        columns = [self.FIELDS.index(field) for field in fields]
+        return [
+            self.names[i]
+            for i in candidates
+            if any(
+                matches(term)
+                for column in columns
+                for term in self.terms[i][column]
+            )
+        ]
@@ -17,24 +17,72 @@
 # along with this program.  If not, see http://www.gnu.org/licenses/.
 
 # Imports {{{1
-from inform import Error, codicil, conjoin, display, full_stop, log, narrate, warn
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import itertools
+import json
+import os
+import re
+
+from inform import (
+    Error, Inform, codicil, conjoin, display, full_stop, log, narrate, warn
+)
 from shlib import Run, to_path, set_prefs
 set_prefs(use_inform=True, log_cmd=True)
 
-from .core import Hosts
+from . import __version__, timings
+from .cache import (
+    AtomicWriter, cache_path, digest, file_digest, save_cache,
+    symlink_atomically, write_atomically
+)
+from .core import MAX_LISTED_HOSTS, Hosts
 from .preferences import (
     ROUTER_MACS,
+    CACHE_DIRECTORY_LISTINGS,
     CONFIG_DIR,
+    DATA_DIR,
     DISCARD_ENTRIES,
+    MANIFEST_FILE,
+    NETWORK_CONFIGS_DIR,
     NMCLI_CONNS,
+    PROBE_TIMEOUT,
+    SEARCH_INDEX_SUFFIX,
+    SHARD_HOSTS,
+    SHARD_SUFFIX,
+    SHARDS_SUFFIX,
     SSH_CONFIG_FILE,
+    SSH_HEADER,
+    SSH_SHARD_HEADER,
     UNKNOWN_NETWORK_NAME,
 )
+from .neighbors import get_neighbor_macs
 from .python import PythonFile
-from .sshconfig import HostEntry, NetworkEntry, locations, ports, set_network_name
-from .utilities import normalize_mac
+from .search import SearchIndex
+from .sshconfig import (
+    HostEntry, NetworkEntry, locations, network_name_used, ports,
+    set_network_name
+)
+from .utilities import (
+    ProbeTimeout, abbreviate_names, gc_paused, mac_to_int, normalize_mac,
+    run_probe
+)
 
 # Globals {{{1
+conf_file_names = "ssh networks locations proxies local hosts".split()
+READ_CHUNK_SIZE = 1 << 16
+HOST_LINE = re.compile(r"^host (\S+)", re.MULTILINE | re.IGNORECASE)
+# the header lines that describe when and how the file was generated
+generated_lines = tuple(
+    line.partition("{")[0]
+    for line in SSH_HEADER.splitlines()
+    if "{time" in line or "{cmdline" in line
+)
+# a header line that identifies the files written by ShardSet
+shard_marker = next(
+    line.partition("{")[0]
+    for line in SSH_SHARD_HEADER.splitlines()
+    if "{config_file" in line
+)
 sshconfig_names = set(
     """
     HostEntry NetworkEntry VNC ports locations is_ip_addr get_network_name
@@ -43,15 +91,227 @@ sshconfig_names = set(
 )
 
 
+# ConfigSummary class {{{1
+class ConfigSummary:
+    """Summarizes an SSH config file as it is read or written.
+
+    Text is fed in pieces of any size.  Afterwards, digest is a digest of the
+    contents other than the header lines that change on every run, and blocks
+    maps the first name of each host entry to a digest of its text.  Only the
+    current paragraph is held in memory.
+    """
+    def __init__(self):
+        self.hash = hashlib.sha256()
+        self.blocks = {}
+        self.partial = ""
+        self.in_header = True
+        self.header = None
+        self.digest = None
+
+    # read() {{{2
+    # summarizes an existing file, returns None if it cannot be read
+    @classmethod
+    def read(cls, path):
+        summary = cls()
+        try:
+            with open(path, encoding="utf-8") as f:
+                for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), ""):
+                    summary.feed(chunk)
+        except (OSError, UnicodeDecodeError):
+            return None
+        return summary.finish()
+
+    # feed() {{{2
+    def feed(self, text):
+        if self.in_header:
+            self.partial += text
+            header, sep, text = self.partial.partition("\n\n")
+            if not sep:
+                return
+            self._header(header + sep)
+            self.partial = ""
+        self.hash.update(text.encode("utf-8"))
+        paragraphs = (self.partial + text).split("\n\n")
+        self.partial = paragraphs.pop()
+        for paragraph in paragraphs:
+            self._paragraph(paragraph)
+
+    # finish() {{{2
+    def finish(self):
+        if self.in_header:
+            self._header(self.partial)
+        else:
+            self._paragraph(self.partial)
+        self.partial = ""
+        self.digest = self.hash.hexdigest()
+        return self
+
+    # _header() {{{2
+    # the first paragraph, the lines that change on every run are ignored
+    def _header(self, header):
+        self.in_header = False
+        self.header = header
+        header = "".join(
+            line for line in header.splitlines(keepends=True)
+            if not line.startswith(generated_lines)
+        )
+        self.hash.update(header.encode("utf-8"))
+
+    # _paragraph() {{{2
+    def _paragraph(self, paragraph):
+        match = HOST_LINE.search(paragraph)
+        if match:
+            self.blocks[match.group(1)] = digest(paragraph.strip())
+
+
+# ShardSet class {{{1
+class ShardSet:
+    """The files that hold the host entries of an SSH config file, by group.
+
+    directory (path):
+        The directory that holds the files, it is created if needed.  Only
+        files whose header shows they were written by sshconfig are replaced
+        or removed, any others are left alone.
+
+    Afterwards, paths are the files in the order they were written, and
+    old_blocks and new_blocks map the first name of each host entry to a
+    digest of its text before and after, as in ConfigSummary.
+    """
+    def __init__(self, directory):
+        self.directory = to_path(directory)
+        self.paths = []
+        self.old_blocks = {}
+        self.new_blocks = {}
+
+    # write() {{{2
+    # the file is only rewritten if its contents change
+    def write(self, group, text):
+        path = self.directory / (group + SHARD_SUFFIX)
+        self.paths.append(path)
+        new = ConfigSummary()
+        new.feed(text)
+        self.new_blocks.update(new.finish().blocks)
+        previous = self._read(path)
+        if previous:
+            self.old_blocks.update(previous.blocks)
+            if previous.digest == new.digest:
+                return
+        elif path.exists():
+            raise Error(
+                "not written by sshconfig, will not replace it.",
+                culprit = path,
+                codicil = "Move or rename the file.",
+            )
+        narrate("writing:", path)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_atomically(path, text.encode("utf-8"))
+
+    # remove_stale() {{{2
+    # removes the files of groups that no longer exist
+    def remove_stale(self):
+        written = set(self.paths)
+        for path in self.directory.glob("*" + SHARD_SUFFIX):
+            if path in written:
+                continue
+            previous = self._read(path)
+            if previous:
+                self.old_blocks.update(previous.blocks)
+                narrate("removing:", path)
+                path.unlink()
+
+    # _read() {{{2
+    # summarizes an existing file, returns None if there is no file or if it
+    # was not written by sshconfig
+    @staticmethod
+    def _read(path):
+        summary = ConfigSummary.read(path)
+        if summary and shard_marker in summary.header:
+            return summary
+        return None
+
+    # includes() {{{2
+    # the Include lines that read the files, in order
+    def includes(self):
+        lines = []
+        for path in self.paths:
+            path = str(path)
+            if any(c.isspace() for c in path):
+                path = f'"{path}"'
+            lines.append(f"Include {path}")
+        return "\n".join(lines)
+
+
+# compare_hosts {{{1
+# finds the host entries that differ between two versions of the config file,
+# given the block digests from their summaries
+def compare_hosts(old, new):
+    changes = [
+        ("changed", [n for n in new if n in old and new[n] != old[n]]),
+        ("added", [n for n in new if n not in old]),
+        ("removed", [n for n in old if n not in new]),
+    ]
+    return [(kind, names) for kind, names in changes if names]
+
+
+# summarize_changes {{{1
+# describes the changes found by compare_hosts() in one line, giving the number
+# of entries of each kind and the first few names
+def summarize_changes(changes):
+    if not changes:
+        return "Host entries are unchanged."
+    return full_stop("Host entries " + "; ".join(
+        f"{kind}: {len(names)} ({abbreviate_names(names, MAX_LISTED_HOSTS)})"
+        for kind, names in changes
+    ))
+
+
 # Settings class {{{1
 class Settings:
     # Constructor {{{2
-    def __init__(self, cmdline):
+    def __init__(self, cmdline, networks=None):
         self.settings = {}
         self.settings = dict()
         self.config_dir = to_path(CONFIG_DIR)
-        self.read_confs()
-        self.set_network(cmdline["--network"])
+        self.hosts_read = False
+        NetworkEntry.clear()
+        HostEntry.clear()
+        with timings.phase("read conf files"):
+            self.read_confs()
+        self.num_conf_hosts = HostEntry.count()
+        with timings.phase("configure network"):
+            if networks is not None:
+                # names of networks from a snapshot, the unknown network is
+                # not found and so is recreated
+                networks = [NetworkEntry.find(name) for name in networks]
+                networks = [network for network in networks if network]
+            self.configure_network(cmdline, networks)
+
+    # snapshot() {{{2
+    # The choices made when configuring the network, used by restore() to
+    # rebuild the settings in another process.  Only names and values are
+    # included, the classes from the conf files cannot be pickled.
+    def snapshot(self):
+        return dict(
+            networks = [network.name() for network in self.networks],
+            options = {
+                "--network": None,
+                "--proxy": self.proxy,
+                "--ports": list(ports.available_ports),
+                "--location": locations.my_location,
+            },
+        )
+
+    # restore() {{{2
+    # rereads the conf files and configures the network as in the snapshot
+    @classmethod
+    def restore(cls, snapshot):
+        return cls(snapshot["options"], snapshot["networks"])
+
+    # configure_network() {{{2
+    # chooses the network, proxy, ports and location
+    # networks may be given if they have already been identified
+    def configure_network(self, cmdline, networks=None):
+        self.set_network(cmdline["--network"], networks)
         self.set_proxy(cmdline["--proxy"])
         self.set_ports(cmdline["--ports"])
         self.set_location(cmdline["--location"])
@@ -59,7 +319,7 @@ class Settings:
     # read_confs() {{{2
     def read_confs(self):
         # read the .conf files in our config directory (except for hosts.conf)
-        for name in "ssh networks locations proxies local".split():
+        for name in conf_file_names[:-1]:
             conf_file = to_path(CONFIG_DIR, name + ".conf")
             if conf_file.exists():
                 settings = PythonFile(conf_file).run()
@@ -78,6 +338,9 @@ class Settings:
                 "path to SSH config file should be absolute.",
                 culprit=self.ssh_config_file,
             )
+        self.search_index_file = self.ssh_config_file.with_name(
+            self.ssh_config_file.name + SEARCH_INDEX_SUFFIX
+        )
         self.ssh_defaults = self.settings.get("DEFAULTS", "")
         self.ssh_overrides = self.settings.get("OVERRIDES", "")
         self.preferred_networks = self.settings.get("PREFERRED_NETWORKS", [])
@@ -85,7 +348,12 @@ class Settings:
         self.proxies = self.settings.get("PROXIES", {})
         self.router_macs = self.settings.get("ROUTER_MACS", ROUTER_MACS)
         self.get_nmcli_conns = self.settings.get("NMCLI_CONNS", NMCLI_CONNS)
+        self.nmcli_timeout = self.settings.get("NMCLI_TIMEOUT", PROBE_TIMEOUT)
         self.discard_entries = self.settings.get("DISCARD_ENTRIES", DISCARD_ENTRIES)
+        self.cache_directory_listings = self.settings.get(
+            "CACHE_DIRECTORY_LISTINGS", CACHE_DIRECTORY_LISTINGS
+        )
+        self.shard_hosts = self.settings.get("SHARD_HOSTS", SHARD_HOSTS)
         self.blocked_ports = self.settings.get("BLOCKED_PORTS", None) or []
         self.blocked_ports = [int(p) for p in self.blocked_ports]
         self.blocked_port_warning = self.settings.get("BLOCKED_PORT_WARNING")
@@ -94,31 +362,138 @@ class Settings:
         self.available_macs = self.settings.get("AVAILABLE_MACS")
         self.available_host_key_algorithms = self.settings.get("AVAILABLE_HOST_KEY_ALGORITHMS")
         self.available_kex_algorithms = self.settings.get("AVAILABLE_KEX_ALGORITHMS")
-
-    # read_hosts() {{{2
+        self.router_index = self.index_routers()
+
+    # index_routers() {{{2
+    # maps the MAC address of each router, as an integer, to its networks
+    def index_routers(self):
+        index = {}
+        for network in NetworkEntry.all_networks():
+            for mac in network.routers:
+                try:
+                    networks = index.setdefault(mac_to_int(mac), [])
+                except ValueError as e:
+                    raise Error(full_stop(e), culprit=network.name())
+                if network not in networks:
+                    networks.append(network)
+        return index
+
+    # load_hosts() {{{2
+    # reads hosts.conf and prepares to process the hosts
     # must be read after port, location, and proxy choices are made
-    def read_hosts(self):
+    # when called again for another network, the hosts already read are reused
+    # unless hosts.conf asked for the name of the network while it was read
+    def load_hosts(self):
         set_network_name(self.primary_network.name())
-        conf_file = to_path(CONFIG_DIR, "hosts.conf")
-        narrate("reading:", conf_file)
-        PythonFile(conf_file).run()
-
-        # Process each host
+        if not self.hosts_read:
+            conf_file = to_path(CONFIG_DIR, "hosts.conf")
+            narrate("reading:", conf_file)
+            HostEntry.clear(keep=self.num_conf_hosts)
+            with timings.phase("read hosts.conf"):
+                PythonFile(conf_file).run()
+            self.hosts_read = not network_name_used()
+        return self.new_hosts()
+
+    # new_hosts() {{{2
+    def new_hosts(self):
         available_networks = [network.name() for network in self.networks]
-        hosts = Hosts(available_networks, self.proxy, self.proxies, self)
-        for host in HostEntry.all_hosts():
-            hosts.process(host, forwards=False)
-            hosts.process(host, forwards=True)
-        self.hosts = hosts
+        self.hosts = Hosts(available_networks, self.proxy, self.proxies, self)
+        return self.hosts
+
+    # read_hosts() {{{2
+    # reads hosts.conf and processes every host, the entries are written to
+    # writer as they are rendered if it is given, or collected by group if
+    # shard is true
+    # if jobs is greater than one the hosts are rendered by that many processes
+    def read_hosts(self, writer=None, jobs=1, shard=False):
+        # the classes and rendered entries are kept until the end of the run
+        with gc_paused():
+            if jobs > 1:
+                hosts = self.new_hosts()
+            else:
+                hosts = self.load_hosts()
+            if shard:
+                hosts.shard()
+            elif writer:
+                hosts.stream(writer)
+            with timings.phase("process hosts"):
+                if jobs > 1:
+                    for rendered in self.render_in_parallel(jobs):
+                        hosts.add(*rendered)
+                else:
+                    for host in HostEntry.all_hosts():
+                        with timings.host(host.__name__.lower()):
+                            hosts.process(host)
+        hosts.report_unknown_settings()
+        with timings.phase("save host cache"):
+            hosts.save_cache()
+
+    # render_in_parallel() {{{2
+    # Renders the hosts in worker processes, each of which renders every
+    # jobs'th host.  Yields the results in the order of the hosts in hosts.conf
+    # so the output is the same as when the hosts are rendered serially.
+    def render_in_parallel(self, jobs):
+        from concurrent.futures import ProcessPoolExecutor
+
+        snapshot = self.snapshot()
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = [
+                pool.submit(render_hosts, snapshot, index, jobs)
+                for index in range(jobs)
+            ]
+            results = [iter(future.result()) for future in futures]
+        for index in itertools.count():
+            try:
+                yield next(results[index % jobs])
+            except StopIteration:
+                return
+
+    # check_network() {{{2
+    # processes every host on the named network without writing anything,
+    # returns the problems found as a list of (severity, culprit, message)
+    def check_network(self, name, options):
+        try:
+            self.configure_network(dict(options, **{"--network": name}))
+            with gc_paused():
+                hosts = self.load_hosts()
+                hosts.collect()
+                for host in HostEntry.all_hosts():
+                    try:
+                        hosts.process(host)
+                    except Error as e:
+                        hosts.diagnostics.append(("error", None, str(e)))
+        except Error as e:
+            return [("error", None, str(e))]
+        return hosts.diagnostics
+
+    # network_names() {{{2
+    # the names of all networks, including the unknown network
+    @staticmethod
+    def network_names():
+        names = [network.name() for network in NetworkEntry.all_networks()]
+        if UNKNOWN_NETWORK_NAME not in names:
+            names.append(UNKNOWN_NETWORK_NAME)
+        return names
+
+    # read_host() {{{2
+    # reads hosts.conf and processes only the host needed to produce the named
+    # SSH host entry, returns the entry or None if it is not found
+    def read_host(self, name):
+        hosts = self.load_hosts()
+        host = hosts.render(name)
+        hosts.report_unknown_settings()
+        return host
 
     # set_network() {{{2
-    def set_network(self, given=None):
-        networks = []
+    def set_network(self, given=None, networks=None):
         if given:
             network = NetworkEntry.find(given)
+            networks = []
         if not given:
-            networks = self.identify_networks()
+            if networks is None:
+                networks = self.identify_networks()
             network = networks[0] if networks else None
+        self.identified_networks = networks
 
         if not network:
 
@@ -136,16 +511,14 @@ class Settings:
             locations.set_location(network.location)
 
     def initialize_network(self):
-        network = self.network
+        network = self.primary_network
 
         # run the init script if given
         try:
-            if network.init_script:
+            if getattr(network, "init_script", None):
                 script = Run(network.init_script, "sOEW")
                 if script.stdout:
                     display(script.stdout.rstrip())
-        except AttributeError:
-            pass
         except Error as e:
             warn(
                 "{} network init_script failed: {}".format(
@@ -191,6 +564,45 @@ class Settings:
             summary.append("proxying through {}".format(self.proxy))
         return full_stop(" ".join(summary))
 
+    # get_router_macs() {{{2
+    # returns the MAC addresses of all devices on active networks
+    def get_router_macs(self):
+        if self.router_macs['style'] == 'native':
+            macs = get_neighbor_macs(self.router_macs.get('source', 'auto'))
+            for mac in macs:
+                log(f"available router MAC: {mac}")
+            return macs
+
+        timeout = self.router_macs.get('timeout', PROBE_TIMEOUT)
+        stdout = run_probe(self.router_macs['executable'], timeout)
+        macs = []
+        for row in stdout.splitlines():
+            if not row:
+                continue
+            try:
+                if self.router_macs['style'] == 'ip':  # for 'ip neighbor'
+                    ip, _, name, status, mac, state = row.split()
+                    if state == 'FAILED':
+                        continue
+                else:
+                    assert self.router_macs['style'] in ['arp', 'custom']
+                    mac = row.split()[int(self.router_macs.get('column', 1))-1]
+                if ':' not in mac:
+                    log(f"available router MAC: {mac} — skipped")
+                    continue
+                mac = normalize_mac(mac)
+                log(f"available router MAC: {mac}")
+                macs.append(mac)
+            except ValueError:
+                log(f"ignoring: {row}")
+                continue
+        return macs
+
+    # get_nmcli_connections() {{{2
+    # returns the names of the active Network Manager connections
+    def get_nmcli_connections(self):
+        return run_probe(self.get_nmcli_conns, self.nmcli_timeout).splitlines()
+
     # identify_networks() {{{2
     # Identifies which networks are currently available
     # uses the arp and nmcli commands
@@ -206,46 +618,50 @@ class Settings:
             for network in NetworkEntry.all_networks():
                 yield network
 
+        # run the probes concurrently, each is subject to its own deadline
+        # if a probe fails or times out, continue with the results of the others
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            get_macs = executor.submit(
+                timings.timed("router MACs", self.get_router_macs)
+            )
+            if self.get_nmcli_conns:
+                get_connections = executor.submit(
+                    timings.timed("nmcli", self.get_nmcli_connections)
+                )
+            else:
+                get_connections = None
+
         # get MAC address of all devices on active networks
-        macs = []
         try:
-
-            process = Run(self.router_macs['executable'], "sOeW")
-            for row in process.stdout.splitlines():
-                if not row:
-                    continue
-                try:
-                    if self.router_macs['style'] == 'ip':  # for 'ip neighbor'
-                        ip, _, name, status, mac, state = row.split()
-                        if state == 'FAILED':
-                            continue
-                    else:
-                        assert self.router_macs['style'] in ['arp', 'custom']
-                        mac = row.split()[int(self.router_macs.get('column', 1))-1]
-                    if ':' not in mac:
-                        log(f"available router MAC: {mac} — skipped")
-                        continue
-                    mac = normalize_mac(mac)
-                    log(f"available router MAC: {mac}")
-                    macs.append(mac)
-                except ValueError:
-                    log(f"ignoring: {row}")
-                    continue
+            macs = get_macs.result()
+        except ProbeTimeout as e:
+            warn("ignoring router MACs:", e.get_message(), culprit=e.get_culprit())
+            macs = []
         except Error as e:
             e.report()
-            return []
-
-        # normalize router MAC addresses in known networks
-        for network in known_networks(self.preferred_networks):
-            network.routers = [normalize_mac(mac) for mac in network.routers]
-
-        # filter out any network devices that are not routers for known networks
-        networks = [
-            network
-            for network in known_networks(self.preferred_networks)
-            for mac in macs
-            if mac in network.routers
-        ]
+            macs = []
+
+        # get the active Network Manager connections
+        connections = []
+        if get_connections:
+            codicil = "Set nmcli_conns setting to None if nmcli is not available."
+            try:
+                connections = get_connections.result()
+            except ProbeTimeout as e:
+                warn("ignoring nmcli:", e.get_message(), culprit=e.get_culprit())
+            except Error as e:
+                e.report(codicil=codicil)
+
+        # find the known networks whose routers are available, keeping the
+        # preferred networks first
+        available = set()
+        for mac in macs:
+            try:
+                available.update(self.router_index.get(mac_to_int(mac), []))
+            except ValueError:
+                log(f"ignoring: {mac}")
+        candidates = list(dict.fromkeys(known_networks(self.preferred_networks)))
+        networks = [network for network in candidates if network in available]
 
         # when on a known network using a vpn, generally want to exclude the 
         # known network from networks to avoid confusion
@@ -259,29 +675,242 @@ class Settings:
             )
         networks = filtered
 
-        # get SSID of WiFi network
+        # add networks identified by the SSID of the WiFi network
         # if only on wifi, this will identify the same network already
         # identified, however this will identify a different network if both a
         # wired and wireless network is active at the same time
-        try:
-            if self.get_nmcli_conns:
-                nmcli = Run(self.get_nmcli_conns, "sOeW")
-                connections = nmcli.stdout.splitlines()
-                for network in known_networks(self.preferred_networks):
-                    if getattr(network, 'nmcli_connection', None) in connections:
-                        networks.append(network)
-        except Error as e:
-            e.report(codicil="Set nmcli_conns setting to None if nmcli is not available.")
+        for network in candidates:
+            if getattr(network, 'nmcli_connection', None) in connections:
+                networks.append(network)
 
         return list(dict.fromkeys(networks))
 
 
-    # write_ssh_config() {{{2
-    def write_ssh_config(self, contents):
-        narrate("writing:", self.ssh_config_file)
+    # conf_mtimes() {{{2
+    # used to determine whether any of the conf files have changed
+    @staticmethod
+    def conf_mtimes():
+        mtimes = []
+        for name in conf_file_names:
+            try:
+                mtimes.append(to_path(CONFIG_DIR, name + ".conf").stat().st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    # conf_digests() {{{2
+    def conf_digests(self):
+        return [
+            file_digest(to_path(CONFIG_DIR, name + ".conf"))
+            for name in conf_file_names
+        ]
+
+    # save_search_index() {{{2
+    # saves an index of the hosts next to the SSH config file for use by find
+    def save_search_index(self, fingerprint):
+        SearchIndex(self.hosts.search_terms, fingerprint).save(
+            self.search_index_file
+        )
+
+    # load_search_index() {{{2
+    # returns the saved index, or None if it was created from different inputs
+    def load_search_index(self):
+        return SearchIndex.load(self.search_index_file, self.fingerprint())
+
+    # fingerprint() {{{2
+    # a digest of the inputs that determine the contents of the SSH config file
+    def fingerprint(self):
+        # the existence of the identity files is approximated by the contents
+        # of the SSH config directory, hosts.conf is not read to determine them;
+        # identity files kept elsewhere are covered by identity_dirs()
+        config_dir = self.ssh_config_file.parent
+        generated = {
+            self.ssh_config_file.name,
+            self.search_index_file.name,
+            self.shards_dir(self.ssh_config_file).name,
+        }
+        try:
+            ssh_files = sorted(
+                name for name in os.listdir(config_dir)
+                if name not in generated and not name.endswith(".tmp")
+            )
+        except OSError:
+            ssh_files = None
+
+        inputs = dict(
+            version = __version__,
+            conf_files = self.conf_digests(),
+            config_file = str(self.ssh_config_file),
+            ssh_files = ssh_files,
+            networks = [network.name() for network in self.networks],
+            proxy = self.proxy,
+            ports = ports.available_ports,
+            location = locations.my_location,
+            algorithms = [
+                self.available_ciphers,
+                self.available_macs,
+                self.available_host_key_algorithms,
+                self.available_kex_algorithms,
+            ],
+        )
+        return digest(repr(sorted(inputs.items())))
+
+    # output_stat() {{{2
+    # identifies the current version of the SSH config file, and of the
+    # directory that holds its host entries if they are sharded
+    def output_stat(self):
+        paths = [self.ssh_config_file]
+        if self.shard_hosts:
+            paths.append(self.shards_dir(self.output_file()))
+        try:
+            stats = [path.stat() for path in paths]
+        except OSError:
+            return None
+        return [
+            value
+            for stat in stats
+            for value in (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        ]
+
+    # is_up_to_date() {{{2
+    # the SSH config file was generated from the same inputs and is unmodified
+    def is_up_to_date(self, fingerprint):
+        try:
+            manifest = json.loads(cache_path(MANIFEST_FILE).read_text())
+        except (OSError, ValueError):
+            return False
+        stat = self.output_stat()
+        identity_dirs = manifest.get("identity_dirs", {})
+        return (
+            stat is not None
+            and manifest.get("fingerprint") == fingerprint
+            and manifest.get("output") == stat
+            and self.identity_dirs(identity_dirs) == identity_dirs
+        )
+
+    # identity_dirs() {{{2
+    # maps each directory to its modification time, which changes when
+    # a file is added to or removed from it
+    @staticmethod
+    def identity_dirs(directories):
+        mtimes = {}
+        for directory in directories:
+            try:
+                mtimes[directory] = os.stat(directory).st_mtime_ns
+            except OSError:
+                mtimes[directory] = None
+        return mtimes
+
+    # save_manifest() {{{2
+    # the directories other than the SSH config directory in which identity
+    # files were sought are recorded, as they are not part of the fingerprint
+    def save_manifest(self, fingerprint):
+        config_dir = str(self.ssh_config_file.parent)
+        directories = [
+            directory for directory in self.hosts.directories.listings
+            if directory != config_dir
+        ]
+        manifest = dict(
+            fingerprint = fingerprint,
+            output = self.output_stat(),
+            identity_dirs = self.identity_dirs(directories),
+        )
+        save_cache(cache_path(MANIFEST_FILE), json.dumps(manifest))
+
+    # output_file() {{{2
+    # the file written by create; if the SSH config file is a link, other than
+    # one made by switch, the file it links to is written so the link remains
+    def output_file(self):
+        path = self.ssh_config_file
+        if path.is_symlink():
+            target = path.resolve()
+            if target.parent != to_path(DATA_DIR, NETWORK_CONFIGS_DIR).resolve():
+                return target
+        return path
+
+    # open_ssh_config() {{{2
+    # returns a writer for a new SSH config file, the file is replaced by
+    # close_ssh_config() so ssh never sees a partial file
+    def open_ssh_config(self):
+        summary = ConfigSummary()
+        writer = AtomicWriter(self.output_file(), tee=summary.feed)
+        writer.summary = summary
+        return writer
+
+    # close_ssh_config() {{{2
+    # the original file is left untouched if only the time and command line
+    # in the header differ
+    # if the hosts were sharded, shards is the value returned by write_shards()
+    def close_ssh_config(self, writer, force=False, shards=None):
+        new = writer.summary.finish()
+        previous = ConfigSummary.read(self.ssh_config_file)
+        if previous:
+            unchanged = not force and previous.digest == new.digest
+            old_blocks = dict(previous.blocks)
+            new_blocks = dict(new.blocks)
+            if shards:
+                old_blocks.update(shards.old_blocks)
+                new_blocks.update(shards.new_blocks)
+            if not unchanged or old_blocks != new_blocks:
+                changes = compare_hosts(old_blocks, new_blocks)
+                display(summarize_changes(changes))
+                for kind, names in changes:
+                    narrate(f"host entries {kind}:", ", ".join(names))
+            if unchanged:
+                narrate("SSH config file is unchanged.")
+                writer.discard()
+                return False
+        narrate("writing:", writer.path)
+        writer.commit()
+        return True
+
+    # shards_dir() {{{2
+    # the directory that holds the host entries included by an SSH config file
+    @staticmethod
+    def shards_dir(config_file):
+        return config_file.with_name(config_file.name + SHARDS_SUFFIX)
+
+    # write_shards() {{{2
+    # writes the entries of each group collected by read_hosts() into its own
+    # file in the directory of config_file, files whose contents are unchanged
+    # are left untouched and files of groups that no longer exist are removed
+    def write_shards(self, config_file):
+        directory = self.shards_dir(config_file)
+        shards = ShardSet(directory)
+        for group, entries in self.hosts.groups.items():
+            header = SSH_SHARD_HEADER.format(
+                group=group, config_file=config_file, config_dir=CONFIG_DIR
+            )
+            shards.write(group, "\n\n".join([header] + entries) + "\n")
+        shards.remove_stale()
+        return shards
+
+    # network_config_file() {{{2
+    # the path to the SSH config file pre-generated for a network
+    @staticmethod
+    def network_config_file(name):
+        return to_path(DATA_DIR, NETWORK_CONFIGS_DIR, name + ".config")
+
+    # open_network_config() {{{2
+    # returns a writer for the SSH config file pre-generated for a network
+    def open_network_config(self, name):
+        path = self.network_config_file(name)
+        narrate("writing:", path)
+        return AtomicWriter(path)
+
+    # link_ssh_config() {{{2
+    # replaces the SSH config file with a link to a pre-generated file
+    def link_ssh_config(self, name):
+        path = self.network_config_file(name)
+        if not path.exists():
+            raise Error(
+                "no SSH config file has been generated for this network.",
+                culprit = name,
+                codicil = "Run 'sshconfig create --all-networks'.",
+            )
+        narrate("linking:", self.ssh_config_file, "→", path)
         self.ssh_config_file.parent.mkdir(parents=True, exist_ok=True)
-        self.ssh_config_file.write_text(contents)
-        self.ssh_config_file.chmod(0o600)
+        symlink_atomically(self.ssh_config_file, path)
 
     # get attribute {{{2
     def __getattr__(self, name):
@@ -291,3 +920,18 @@ class Settings:
     def __iter__(self):
         for key in sorted(self.settings.keys()):
             yield key, self.settings[key]
+
+
+# render_hosts {{{1
+# Runs in a worker process started by Settings.render_in_parallel().  Rebuilds
+# the settings from the snapshot, reads hosts.conf, and renders every jobs'th
+# host starting with the index'th.  Messages are returned with the rendered
+# hosts and are reported by the parent process.
+def render_hosts(snapshot, index, jobs):
+    with Inform(mute=True):
+        settings = Settings.restore(snapshot)
+        hosts = settings.load_hosts()
+        return [
+            hosts.render_entry(host)
+            for host in itertools.islice(HostEntry.all_hosts(), index, None, jobs)
+        ]
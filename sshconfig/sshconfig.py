@@ -5,13 +5,21 @@
 # Imports {{{1
 from inform import Error, full_stop, is_str
 from shlib import Run, set_prefs as shlib_set_prefs
+import json
+import os
 import re
+import shutil
+
+from .cache import cache_path, save_cache
+from .preferences import SSH_QUERIES_FILE
 
 # Globals {{{1
 KEYS_TO_INHERIT = ["user", "identityFile"]
 LOWER_TO_UPPER_TRANSITION = re.compile(r"([a-z])([A-Z])")
 CHOSEN_NETWORK_NAME = None
+NETWORK_NAME_USED = False
 FALLBACK_ALGORITHMS = {}
+SSH_QUERIES = None
 shlib_set_prefs(use_inform=True)
 
 # Utilities {{{1
@@ -19,21 +27,83 @@ shlib_set_prefs(use_inform=True)
 # called from main with the name of the chosen network
 # allows users to change their configuration based on the active network
 def set_network_name(name):
-    global CHOSEN_NETWORK_NAME
+    global CHOSEN_NETWORK_NAME, NETWORK_NAME_USED
     CHOSEN_NETWORK_NAME = name.lower()
+    NETWORK_NAME_USED = False
 
 
 # get_network_name {{{2
 def get_network_name():
     "Returns name of network (lowercase)"
+    global NETWORK_NAME_USED
+    NETWORK_NAME_USED = True
     return CHOSEN_NETWORK_NAME
 
 
+# network_name_used {{{2
+# whether get_network_name() has been called since the network was set
+def network_name_used():
+    return NETWORK_NAME_USED
+
+
 # is_ip_addr {{{2
 def is_ip_addr(addr):
     return re.match(r"\A\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\s*\Z", addr)
 
 
+# get_ssh_queries {{{2
+# Returns the cached results of 'ssh -Q'.
+# The results are kept in memory and on disk.  The disk cache is keyed by the
+# path, size and modification time of the ssh executable, and is discarded
+# when the version reported by 'ssh -V' changes.
+def get_ssh_queries():
+    global SSH_QUERIES
+    if SSH_QUERIES is not None:
+        return SSH_QUERIES
+
+    executable = shutil.which('ssh')
+    try:
+        stat = os.stat(executable)
+        identity = [executable, stat.st_size, stat.st_mtime_ns]
+    except (TypeError, OSError):
+        identity = None
+    try:
+        cache = json.loads(cache_path(SSH_QUERIES_FILE).read_text())
+    except (OSError, ValueError):
+        cache = {}
+
+    if not identity or cache.get('ssh') != identity:
+        # the ssh executable has changed, check whether its version has
+        try:
+            version = Run(['ssh', '-V'], modes='sOEW').stderr.strip()
+        except Error:
+            version = None
+        if not version or cache.get('version') != version:
+            cache = dict(queries={})
+        cache.update(ssh=identity, version=version)
+        save_cache(cache_path(SSH_QUERIES_FILE), json.dumps(cache))
+    SSH_QUERIES = cache
+    return cache
+
+
+# query_ssh {{{2
+# Returns the algorithms of a class that are supported by ssh.
+# Returns None if ssh does not support -Q.
+def query_ssh(name):
+    cache = get_ssh_queries()
+    queries = cache['queries']
+    if name not in queries:
+        try:
+            ssh = Run(['ssh', '-Q', name], modes='sOEW')
+            queries[name] = ssh.stdout.split()
+        except Error as e:
+            # this should only occur on old version of ssh that don't support -Q
+            assert 'option' in e.stderr and 'Q' in e.stderr
+            queries[name] = None
+        save_cache(cache_path(SSH_QUERIES_FILE), json.dumps(cache))
+    return queries[name]
+
+
 # filter_algorithms {{{2
 def filter_algorithms(name, desired=(), fallback=()):
     """Filter Algorithms
@@ -49,6 +119,8 @@ def filter_algorithms(name, desired=(), fallback=()):
     fallback (str or array):
         The ordered list of algorithms to use if no desired algorithms are
         available.
+
+    The available algorithms are only queried from ssh once per version of ssh.
     """
 
     if is_str(desired):
@@ -60,12 +132,8 @@ def filter_algorithms(name, desired=(), fallback=()):
         fallback = FALLBACK_ALGORITHMS.get(name, [])
     FALLBACK_ALGORITHMS[name] = fallback
 
-    try:
-        ssh = Run(['ssh', '-Q', name], modes='sOEW')
-        available = ssh.stdout.split()
-    except Error as e:
-        # this should only occur on old version of ssh that don't support -Q
-        assert 'option' in e.stderr and 'Q' in e.stderr
+    available = query_ssh(name)
+    if available is None:
         available = fallback
 
     filtered = [d for d in desired if d in available]
@@ -94,16 +162,46 @@ class NetworkEntry:
     location = None
     proxy = None
 
+    # registry of known networks, filled as the subclasses are created
+    # the registry is modified in place, assigning class attributes would
+    # invalidate the attribute caches of every subclass
+    _networks = {}  # lowercase class name -> network, in order of creation
+    _names = {}  # lowercase key and class name -> network
+    _derived = {}  # 'known' -> frozen set of the keys of _names
+
     def __init__(self):
         raise NotImplementedError
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        registry = NetworkEntry
+
+        # a network that is redefined replaces the original
+        name = cls.__name__.lower()
+        previous = registry._networks.pop(name, None)
+        if previous:
+            for k, v in list(registry._names.items()):
+                if v is previous:
+                    del registry._names[k]
+
+        # if networks share a name, the first one defined takes precedence
+        registry._networks[name] = cls
+        if cls.key:
+            registry._names.setdefault(cls.key.lower(), cls)
+        registry._names.setdefault(name, cls)
+        registry._derived.clear()
+
+    @classmethod
+    def clear(cls):
+        # forget all networks, used before the conf files are read again
+        NetworkEntry._networks.clear()
+        NetworkEntry._names.clear()
+        NetworkEntry._derived.clear()
+
     @classmethod
     def all_networks(cls):
-        # yields all known networks
-        for subclass in cls.__subclasses__():
-            yield subclass
-            for subclass in subclass.all_networks():
-                yield subclass
+        # yields all known networks, including those derived from other networks
+        yield from list(NetworkEntry._networks.values())
 
     @classmethod
     def name(cls):
@@ -143,21 +241,15 @@ class NetworkEntry:
 
     @classmethod
     def find(cls, name):
-        name = name.lower()
-        for subclass in cls.__subclasses__():
-            if subclass.key and subclass.key.lower() == name:
-                return subclass
-            if subclass.__name__.lower() == name:
-                return subclass
-        return None
+        return NetworkEntry._names.get(name.lower())
 
     @classmethod
     def known(cls):
-        # yields the names associated with any known network
-        for subclass in cls.__subclasses__():
-            if subclass.key:
-                yield subclass.key.lower()
-            yield subclass.__name__.lower()
+        # returns the names associated with any known network as a frozen set
+        derived = NetworkEntry._derived
+        if "known" not in derived:
+            derived["known"] = frozenset(NetworkEntry._names)
+        return derived["known"]
 
     @classmethod
     def get_location(cls, given=None):
@@ -167,15 +259,82 @@ class NetworkEntry:
 # HostEntry class {{{1
 # Used to describe an available host
 class HostEntry:
+    # registry of hosts, filled as the subclasses are created
+    # the registry is modified in place, assigning class attributes would
+    # invalidate the attribute caches of every subclass, which makes reading
+    # hosts.conf quadratic in the number of hosts
+    _hosts = []  # in order of creation
+    _derived = {}  # computed from _hosts when first needed:
+        # 'children': host -> subclasses sorted by name
+        # 'ordered': all hosts in the order they are output
+        # 'index': names and aliases -> host
+    _fields = {}  # host -> fields, computed when first needed
+
     def __init__(self):
         raise NotImplementedError
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        HostEntry._hosts.append(cls)
+        HostEntry._derived.clear()
+
+    @classmethod
+    def clear(cls, keep=0):
+        # forget all but the first keep hosts, used before hosts.conf is read
+        # again
+        for host in HostEntry._hosts[keep:]:
+            HostEntry._fields.pop(host, None)
+        del HostEntry._hosts[keep:]
+        HostEntry._derived.clear()
+
+    @classmethod
+    def count(cls):
+        # the number of hosts created so far
+        return len(HostEntry._hosts)
+
     @classmethod
     def all_hosts(cls):
-        for subclass in sorted(cls.__subclasses__(), key=lambda s: s.__name__):
-            yield subclass
-            for subclass in subclass.all_hosts():
-                yield subclass
+        # yields the descendants of this class, depth first with the children
+        # of each host sorted by name
+        derived = HostEntry._derived
+        if "children" not in derived:
+            children = {}
+            for host in HostEntry._hosts:
+                for parent in host.__bases__:
+                    children.setdefault(parent, []).append(host)
+            for subclasses in children.values():
+                subclasses.sort(key=lambda s: s.__name__)
+            derived["children"] = children
+        if cls is HostEntry and "ordered" in derived:
+            return iter(derived["ordered"])
+
+        children = derived["children"]
+        hosts = []
+        stack = list(reversed(children.get(cls, [])))
+        while stack:
+            host = stack.pop()
+            hosts.append(host)
+            stack.extend(reversed(children.get(host, [])))
+        if cls is HostEntry:
+            derived["ordered"] = tuple(hosts)
+        return iter(hosts)
+
+    @classmethod
+    def find(cls, name):
+        # returns the host with the given name or alias, None if there is none
+        derived = HostEntry._derived
+        if "index" not in derived:
+            index = {}
+            for host in HostEntry.all_hosts():
+                index.setdefault(host.name(), host)
+                for key, value in host.fields().items():
+                    if key.lower() == "aliases":
+                        for alias in value:
+                            if isinstance(alias, tuple):
+                                alias = alias[0]
+                            index.setdefault(alias, host)
+            derived["index"] = index
+        return derived["index"].get(name)
 
     @classmethod
     def name(cls):
@@ -183,6 +342,15 @@ class HostEntry:
 
     @classmethod
     def fields(cls):
+        # the fields are computed once and shared, do not modify them
+        try:
+            return HostEntry._fields[cls]
+        except KeyError:
+            fields = HostEntry._fields[cls] = cls._compute_fields()
+            return fields
+
+    @classmethod
+    def _compute_fields(cls):
         parents = cls.__bases__
         assert len(parents) == 1
         parent = parents[0]
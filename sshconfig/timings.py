@@ -0,0 +1,140 @@
+# Timings
+#
+# Records the wall clock and CPU time spent in each phase of a run, along with
+# the time spent processing each host, for the --timings option.
+
+# License {{{1
+# Copyright (C) 2018-2023 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see http://www.gnu.org/licenses.
+
+
+# Imports {{{1
+from contextlib import contextmanager
+import json
+from time import perf_counter, process_time
+
+from inform import output
+
+from .preferences import SLOWEST_HOSTS
+
+# Globals {{{1
+enabled = False
+phases = []  # dictionaries with name, depth, wall and cpu
+hosts = {}  # host name -> wall clock time
+depth = 0
+
+
+# enable {{{1
+def enable():
+    global enabled
+    enabled = True
+
+
+# phase {{{1
+@contextmanager
+def phase(name):
+    "Record the time spent in the body of the with statement."
+    global depth
+    if not enabled:
+        yield
+        return
+    entry = dict(name=name, depth=depth)
+    phases.append(entry)
+    depth += 1
+    wall, cpu = perf_counter(), process_time()
+    try:
+        yield
+    finally:
+        entry.update(wall=perf_counter() - wall, cpu=process_time() - cpu)
+        depth -= 1
+
+
+# timed {{{1
+def timed(name, func):
+    """Wrap a function so the time it takes is recorded as a phase.
+
+    For use with functions that are run in other threads.  The phase is
+    recorded at the depth of the caller, and the CPU time includes that used by
+    any concurrently running threads.
+    """
+    if not enabled:
+        return func
+    entry = dict(name=name, depth=depth)
+    phases.append(entry)
+
+    def wrapper(*args, **kwargs):
+        wall, cpu = perf_counter(), process_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            entry.update(wall=perf_counter() - wall, cpu=process_time() - cpu)
+
+    return wrapper
+
+
+# host {{{1
+@contextmanager
+def host(name):
+    "Record the time spent processing a host."
+    if not enabled:
+        yield
+        return
+    wall = perf_counter()
+    try:
+        yield
+    finally:
+        hosts[name] = hosts.get(name, 0) + perf_counter() - wall
+
+
+# slowest_hosts {{{1
+def slowest_hosts(count=SLOWEST_HOSTS):
+    return sorted(hosts.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+# report {{{1
+def report():
+    "Output a table of the phases and the slowest hosts."
+    rows = [("phase", "wall (ms)", "cpu (ms)")]
+    for entry in phases:
+        if "wall" in entry:
+            rows.append((
+                "  " * entry["depth"] + entry["name"],
+                f"{1000*entry['wall']:.1f}",
+                f"{1000*entry['cpu']:.1f}",
+            ))
+    slowest = slowest_hosts()
+    if slowest:
+        rows.append(("", "", ""))
+        rows.append(("slowest hosts", "wall (ms)", ""))
+        for name, wall in slowest:
+            rows.append(("  " + name, f"{1000*wall:.2f}", ""))
+    width = max(len(row[0]) for row in rows)
+    for name, wall, cpu in rows:
+        output(f"{name:<{width}}  {wall:>10}  {cpu:>10}".rstrip())
+
+
+# save {{{1
+def save(path):
+    "Write the phases and the slowest hosts to a file as JSON."
+    data = dict(
+        phases = [entry for entry in phases if "wall" in entry],
+        slowest_hosts = [
+            dict(name=name, wall=wall) for name, wall in slowest_hosts()
+        ],
+        num_hosts = len(hosts),
+    )
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
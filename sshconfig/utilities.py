@@ -15,9 +15,15 @@
 # along with this program.  If not, see http://www.gnu.org/licenses/.
 
 # Imports {{{1
+from contextlib import contextmanager
+from inform import Error, full_stop, log, os_error
 from shlib import Run
+import gc
 import os
+import re
+import shlex
 import socket
+import subprocess
 import pwd
 
 
@@ -38,6 +44,129 @@ def pager(text):
     Run([program], stdin=text, modes='Woes')
 
 
+# format_date {{{1
+# formats a datetime using the tokens supported by arrow, which is too slow to
+# import just to create the header of the SSH config file
+DATE_TOKENS = re.compile(
+    r"\[[^\]]*\]|YYYY|YY|MMMM|MMM|MM|M|DDDD|DDD|DD|D|dddd|ddd|d"
+    r"|HH|H|hh|h|mm|m|ss|s|A|a|ZZ|Z"
+)
+
+
+def format_date(when, fmt):
+    """Format a datetime using arrow's formatting tokens.
+
+    when (datetime):
+        The date and time, it should be timezone aware if Z or ZZ are used.
+    fmt (str):
+        The format string.  Text enclosed in brackets is passed unchanged.
+    """
+    def hour12():
+        return when.hour % 12 or 12
+
+    def offset(sep):
+        minutes = int(when.utcoffset().total_seconds() // 60)
+        sign = "-" if minutes < 0 else "+"
+        hours, minutes = divmod(abs(minutes), 60)
+        return f"{sign}{hours:02d}{sep}{minutes:02d}"
+
+    tokens = dict(
+        YYYY = lambda: f"{when.year:04d}",
+        YY = lambda: f"{when.year:04d}"[2:],
+        MMMM = lambda: when.strftime("%B"),
+        MMM = lambda: when.strftime("%b"),
+        MM = lambda: f"{when.month:02d}",
+        M = lambda: str(when.month),
+        DDDD = lambda: f"{when.timetuple().tm_yday:03d}",
+        DDD = lambda: str(when.timetuple().tm_yday),
+        DD = lambda: f"{when.day:02d}",
+        D = lambda: str(when.day),
+        dddd = lambda: when.strftime("%A"),
+        ddd = lambda: when.strftime("%a"),
+        d = lambda: str(when.isoweekday()),
+        HH = lambda: f"{when.hour:02d}",
+        H = lambda: str(when.hour),
+        hh = lambda: f"{hour12():02d}",
+        h = lambda: str(hour12()),
+        mm = lambda: f"{when.minute:02d}",
+        m = lambda: str(when.minute),
+        ss = lambda: f"{when.second:02d}",
+        s = lambda: str(when.second),
+        A = lambda: "AM" if when.hour < 12 else "PM",
+        a = lambda: "am" if when.hour < 12 else "pm",
+        ZZ = lambda: offset(":"),
+        Z = lambda: offset(""),
+    )
+
+    def replace(match):
+        token = match.group(0)
+        if token.startswith("["):
+            return token[1:-1]
+        return tokens[token]()
+
+    return DATE_TOKENS.sub(replace, fmt)
+
+
+# gc_paused {{{1
+# Suspend the cyclic garbage collector while creating many objects that are
+# kept, so it does not repeatedly examine objects that are bound to survive.
+# Objects are still freed when no longer referenced.
+@contextmanager
+def gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# run_probe {{{1
+class ProbeTimeout(Error):
+    pass
+
+
+def run_probe(cmd, timeout):
+    """Run a command that probes the network and return its output.
+
+    The command is killed if it does not complete within timeout seconds, in
+    which case ProbeTimeout is raised.  Error is raised if it fails.
+    """
+    if isinstance(cmd, str):
+        # split as shlib's Run does, so quoted arguments are honored
+        try:
+            cmd = shlex.split(cmd)
+        except ValueError as e:
+            raise Error(full_stop(e), culprit=cmd)
+    log("running:", " ".join(cmd))
+    try:
+        process = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            timeout=timeout, universal_newlines=True
+        )
+    except subprocess.TimeoutExpired:
+        raise ProbeTimeout(f"timed out after {timeout} seconds.", culprit=cmd[0])
+    except OSError as e:
+        raise Error(os_error(e))
+    if process.returncode:
+        raise Error(
+            process.stderr.strip() or f"exit status {process.returncode}.",
+            culprit=cmd[0]
+        )
+    return process.stdout
+
+
+# abbreviate_names {{{1
+# joins the first few names, noting how many others there are
+def abbreviate_names(names, limit):
+    names = list(names)
+    listed = names[:limit]
+    if len(names) > len(listed):
+        listed.append(f"and {len(names) - len(listed)} more")
+    return ", ".join(listed)
+
+
 # two_columns {{{1
 def two_columns(col1, col2, width=16, indent=True):
     indent = '    '
@@ -74,6 +203,20 @@ def error_source():
         line = tb.tb_next.tb_lineno
     return filename, 'line %s' % line
 
+# mac_to_int {{{1
+# converts a MAC address to a 48-bit integer
+def mac_to_int(mac):
+    octets = mac.replace('-', ':').split(':')
+    if len(octets) != 6:
+        raise ValueError(f"invalid MAC address: {mac}")
+    value = 0
+    for octet in octets:
+        octet = int(octet, 16)
+        if not 0 <= octet <= 255:
+            raise ValueError(f"invalid MAC address: {mac}")
+        value = (value << 8) | octet
+    return value
+
 # normalize_mac {{{1
 def normalize_mac(mac):
     return ':'.join((normalize_hex(s) for s in mac.split(':')))
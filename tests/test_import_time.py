@@ -0,0 +1,53 @@
+# Test that the command line interface imports quickly.
+
+# Imports {{{1
+from pathlib import Path
+import os
+import subprocess
+import sys
+
+# Globals {{{1
+SOURCE_DIR = Path(__file__).resolve().parent.parent
+REPEAT = 5
+BUDGET = 0.100  # seconds, for sshconfig.main and everything it imports
+    # most of this is inform, which always imports arrow
+OWN_BUDGET = 0.015  # seconds, for the modules of sshconfig alone
+DEFERRED = "sshconfig.sshconfig sshconfig.settings sshconfig.command shlib".split()
+
+
+# import_times() {{{1
+# imports sshconfig.main in a new interpreter, returns the self and cumulative
+# times of each module in seconds, taken from the output of -X importtime
+def import_times():
+    env = dict(os.environ, PYTHONPATH=str(SOURCE_DIR))
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import sshconfig.main"],
+        env=env, cwd=SOURCE_DIR, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.partition(":")[2].split("|")
+        if len(fields) == 3 and fields[0].strip().isdigit():
+            times[fields[2].strip()] = int(fields[0]) / 1e6, int(fields[1]) / 1e6
+    return times
+
+
+# tests {{{1
+def test_import_time():
+    runs = [import_times() for i in range(REPEAT)]
+    total = min(times["sshconfig.main"][1] for times in runs)
+    own = min(
+        sum(t[0] for name, t in times.items() if name.split(".")[0] == "sshconfig")
+        for times in runs
+    )
+    assert total < BUDGET, f"import takes {1000*total:.1f} ms"
+    assert own < OWN_BUDGET, f"sshconfig modules take {1000*own:.1f} ms"
+
+
+def test_deferred_imports():
+    # the commands, settings and host classes are only imported when needed
+    times = import_times()
+    imported = [name for name in DEFERRED if name in times]
+    assert not imported, imported
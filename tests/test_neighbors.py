@@ -0,0 +1,123 @@
+# Test the parsers of the kernel neighbor table against canned data.
+
+# Imports {{{1
+import errno
+from pathlib import Path
+import struct
+import sys
+
+from inform import Error
+import pytest
+
+from sshconfig import neighbors
+from sshconfig.neighbors import (
+    NLMSG_ERROR, NLMSGHDR, NetworkMonitor, parse_neighbor_messages,
+    parse_proc_arp
+)
+
+# Globals {{{1
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+# read_hex() {{{1
+# reads a fixture written as hexadecimal bytes, lines starting with # are
+# comments
+def read_hex(name):
+    lines = (FIXTURES / name).read_text().splitlines()
+    return bytes.fromhex(" ".join(line for line in lines if not line.startswith("#")))
+
+
+# /proc/net/arp {{{1
+def test_proc_arp():
+    text = (FIXTURES / "proc_net_arp").read_text()
+    assert list(parse_proc_arp(text)) == [
+        "0:1a:2b:3c:4d:5e", "a4:b1:c2:d3:e4:f5", "2:42:ac:11:0:2"
+    ]
+
+
+def test_proc_arp_bytes():
+    text = (FIXTURES / "proc_net_arp").read_text()
+    data = (FIXTURES / "proc_net_arp").read_bytes()
+    assert list(parse_proc_arp(data)) == list(parse_proc_arp(text))
+
+
+# rtnetlink {{{1
+@pytest.mark.skipif(sys.byteorder != "little", reason="fixture is little endian")
+def test_netlink():
+    data = read_hex("neighbors.netlink")
+    assert list(parse_neighbor_messages(data)) == [
+        "0:1a:2b:3c:4d:5e", "a4:b1:c2:d3:e4:f5", "2:42:ac:11:0:2", None
+    ]
+
+
+@pytest.mark.skipif(sys.byteorder != "little", reason="fixture is little endian")
+def test_netlink_partial():
+    # a dump that continues in the next message yields no terminating None
+    data = read_hex("neighbors.netlink")
+    done = NLMSGHDR.size + 4
+    assert list(parse_neighbor_messages(data[:-done])) == [
+        "0:1a:2b:3c:4d:5e", "a4:b1:c2:d3:e4:f5", "2:42:ac:11:0:2"
+    ]
+
+
+def test_netlink_error():
+    data = NLMSGHDR.pack(NLMSGHDR.size + 4, NLMSG_ERROR, 0, 1, 0)
+    data += struct.pack("=i", -1)
+    with pytest.raises(Error):
+        list(parse_neighbor_messages(data))
+
+
+# NetworkMonitor {{{1
+# a netlink socket whose recv() returns or raises each of the given results
+class FakeSocket:
+    def __init__(self, *results):
+        self.results = list(results)
+
+    def recv(self, size):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        pass
+
+
+def monitor(monkeypatch, sock):
+    monkeypatch.setattr(neighbors.select, "select", lambda r, w, x, t: (r, w, x))
+    monitor = NetworkMonitor.__new__(NetworkMonitor)
+    monitor.sock = sock
+    monitor.tables = None
+    return monitor
+
+
+def test_monitor_overflow(monkeypatch):
+    # a burst that overflows the socket buffer is a change, not a failure
+    sock = FakeSocket(
+        b"message", OSError(errno.ENOBUFS, "No buffer space available"),
+        b"message", BlockingIOError()
+    )
+    watcher = monitor(monkeypatch, sock)
+    assert watcher.wait(1) is True
+    assert watcher.sock is sock and not sock.results
+
+
+def test_monitor_failure(monkeypatch):
+    # any other error falls back to polling
+    watcher = monitor(monkeypatch, FakeSocket(OSError(errno.EBADF, "Bad")))
+    assert watcher.wait(1) is True
+    assert watcher.sock is None and watcher.tables is not None
+
+
+# get_neighbor_macs() {{{1
+def test_auto_fallback(monkeypatch):
+    # falls back to /proc/net/arp if the rtnetlink socket cannot be used
+    def read_netlink():
+        raise PermissionError(errno.EACCES, "Permission denied")
+    monkeypatch.setattr(neighbors, "read_netlink", read_netlink)
+    monkeypatch.setattr(neighbors, "PROC_ARP", str(FIXTURES / "proc_net_arp"))
+    assert neighbors.get_neighbor_macs() == [
+        "0:1a:2b:3c:4d:5e", "a4:b1:c2:d3:e4:f5", "2:42:ac:11:0:2"
+    ]
+    with pytest.raises(Error):
+        neighbors.get_neighbor_macs("netlink")